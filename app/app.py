@@ -1,7 +1,11 @@
 import streamlit as st
 import os
-from worker import process
-from utils import save_uploaded_file, cleanup_temp
+import time
+from concurrent.futures import ThreadPoolExecutor
+from worker import process, find_masters, add_master
+from utils import save_uploaded_file, release_uploaded_file
+from scheduler import Ticket, get_scheduler, PROCESS_SLOTS
+from results import get_result_store
 import hashlib
 
 def file_hash(file):
@@ -88,7 +92,58 @@ with c2:
 
 
 # =====================================================
-# ⭐ AUTO CLEAR OLD RESULTS + TEMP FILES
+# TEMPLATE LIBRARY
+# =====================================================
+
+with st.sidebar:
+
+    st.subheader("📚 Template Library")
+
+    library_file = st.file_uploader(
+        "Add a master template",
+        type=["pdf","docx"],
+        key="library_upload"
+    )
+
+    if library_file and st.button("➕ Add to library"):
+
+        try:
+            path = save_uploaded_file(library_file)
+            try:
+                add_master(path, library_file.name)
+            finally:
+                release_uploaded_file(path)
+            st.success(f"Added {library_file.name}")
+        except Exception as e:
+            st.error(str(e))
+
+
+# =====================================================
+# RESULT HISTORY
+# =====================================================
+
+with st.sidebar:
+
+    st.subheader("🗄️ Comparison History")
+
+    history = get_result_store()
+
+    reason_filter = st.selectbox(
+        "Filter by finding",
+        ["(any)"] + history.reasons()
+    )
+
+    if reason_filter == "(any)":
+        min_risk = st.number_input("Minimum risk", min_value=0, value=9)
+        rows = history.by_risk(min_risk)
+    else:
+        rows = history.by_reason(reason_filter)
+
+    st.dataframe(rows, use_container_width=True)
+
+
+# =====================================================
+# ⭐ AUTO CLEAR OLD RESULTS
 # =====================================================
 
 current_files = (
@@ -103,41 +158,143 @@ if "last_files" not in st.session_state:
 if st.session_state.last_files != current_files:
 
     st.session_state.pop("result", None)
+    st.session_state.pop("candidates", None)
+    st.session_state.pop("library_master", None)
 
-    # 🔥 DELETE OLD TEMP FILES
-    cleanup_temp()
+    # temp files are evicted by the upload store's janitor
 
     st.session_state.last_files = current_files
 
 
+# =====================================================
+# AUTO MASTER LOOKUP
+# =====================================================
+
+if test_file and not master_file:
+
+    if st.button("🔍 Find matching master in library"):
+
+        with st.spinner("Searching template library..."):
+
+            try:
+                test_path = save_uploaded_file(test_file)
+                try:
+                    st.session_state.candidates = find_masters(test_path)
+                finally:
+                    release_uploaded_file(test_path)
+            except Exception as e:
+                st.error(str(e))
+
+    candidates = st.session_state.get("candidates")
+
+    if candidates:
+
+        choice = st.radio(
+            "Best matching masters",
+            candidates,
+            format_func=lambda c: f"{c['name']} — {c['similarity']:.0%} similar"
+        )
+
+        st.session_state.library_master = choice["path"]
+
+    elif candidates is not None:
+        st.warning("No similar master found in the library.")
+
+
 # =====================================================
 # RUN ANALYSIS
 # =====================================================
 
-if master_file and test_file:
+library_master = st.session_state.get("library_master")
 
-    if st.button("🚀 Run Deep Analysis"):
-        master_file.seek(0)
-        test_file.seek(0)
+if (master_file or library_master) and test_file:
+
+    mode = st.radio(
+        "Alignment",
+        ["sentence", "section"],
+        format_func=lambda m: {
+            "sentence": "Sentence (whole document)",
+            "section": "Section / clause (long contracts)"
+        }[m],
+        horizontal=True
+    )
 
+    low_memory = st.checkbox(
+        "Low-memory mode (1,000+ page documents)",
+        disabled=mode != "sentence"
+    )
 
-        # EXTRA SAFETY — clean before run
-        cleanup_temp()
+    incremental = st.checkbox(
+        "Incremental (reuse unchanged pages from earlier revisions)",
+        disabled=mode != "sentence" or low_memory
+    )
+
+    parallel = st.checkbox(
+        "Parallel (score sentences on all CPU cores, same result)",
+        disabled=mode != "sentence" or low_memory or incremental
+    )
+
+    if st.button("🚀 Run Deep Analysis"):
 
         with st.spinner("Analyzing legal risks..."):
 
+            master_path = test_path = None
+
             try:
 
-                master_path = save_uploaded_file(master_file)
+                if master_file:
+                    master_path = save_uploaded_file(master_file)
+                else:
+                    master_path = library_master
                 test_path = save_uploaded_file(test_file)
 
-                result = process(master_path, test_path)
+                ticket = Ticket()
+
+                # run in the background so the queue position can update
+                with ThreadPoolExecutor(max_workers=1) as executor:
+
+                    future = executor.submit(
+                        process,
+                        master_path,
+                        test_path,
+                        mode=mode,
+                        low_memory=low_memory and mode == "sentence",
+                        spill_dir=TEMP_DIR,
+                        incremental=incremental and mode == "sentence",
+                        ticket=ticket,
+                        workers=PROCESS_SLOTS if parallel else None
+                    )
+
+                    queue_box = st.empty()
+
+                    while not future.done():
+
+                        position = get_scheduler().position(ticket)
+
+                        if position:
+                            queue_box.info(
+                                f"⏳ Waiting in queue — position {position}"
+                            )
+                        else:
+                            queue_box.empty()
+
+                        time.sleep(0.5)
+
+                    queue_box.empty()
+
+                result = future.result()
 
                 st.session_state.result = result
 
             except Exception as e:
                 st.error(str(e))
 
+            finally:
+                # uploads stay cached until the janitor evicts them
+                for path in (master_path, test_path):
+                    if path:
+                        release_uploaded_file(path)
+
 
 # =====================================================
 # RESULTS
@@ -176,6 +333,25 @@ if "result" in st.session_state:
     with d3:
         st.metric("Flags Raised", len(reasons))
 
+    if result.get("from_store"):
+        st.caption("⚡ Same documents and engine seen before — result loaded from store")
+
+    if result.get("peak_rss_mb"):
+        st.caption(
+            f"Server process peak memory (since start): "
+            f"{result['peak_rss_mb']} MB"
+        )
+
+    if "reused" in result:
+        reused = result["reused"]
+        st.caption(
+            f"♻️ Reused {len(reused['pages_reused'])} page comparisons, "
+            f"re-compared {len(reused['pages_compared'])}; "
+            f"extraction cache hits: "
+            f"{len(reused['extraction_cached']['master'])} master / "
+            f"{len(reused['extraction_cached']['test'])} test pages"
+        )
+
     st.divider()
 
 
@@ -193,12 +369,31 @@ if "result" in st.session_state:
         st.divider()
 
 
+    # =====================================================
+    # SECTION MAP
+    # =====================================================
+
+    if "sections" in result:
+
+        st.subheader("🗂️ Section Alignment")
+
+        st.dataframe(result["sections"], use_container_width=True)
+
+        st.divider()
+
+
     # =====================================================
     # FULL DOCUMENT VIEW
     # =====================================================
 
     st.subheader("📑 Full Document Comparison")
 
+    if result.get("moves"):
+        st.caption(
+            f"🔵 {len(result['moves'])} moved block(s) shown in blue "
+            "instead of as deletions + insertions"
+        )
+
     col1, col2 = st.columns(2)
 
     with col1:
@@ -0,0 +1,219 @@
+"""
+Offline benchmarks for the comparison engine.
+
+Usage:
+    python bench.py extract file1.pdf [file2.pdf ...]
+    python bench.py compare master.pdf test.pdf
+    python bench.py compare --synthetic 20000
+"""
+
+import os
+import sys
+import time
+import random
+import statistics
+
+import fitz
+
+import loader
+import comparator
+
+
+# =====================================================
+# HELPERS
+# =====================================================
+
+def timed(func, *args, repeat=3, **kwargs):
+    """
+    Run func `repeat` times, return (median seconds, last result).
+    """
+
+    runs = []
+    result = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        runs.append(time.perf_counter() - start)
+
+    return statistics.median(runs), result
+
+
+# =====================================================
+# EXTRACTION MODES
+# =====================================================
+
+def extract_all(pdf_path, mode):
+    """
+    Native text layer only (no OCR), single thread,
+    so the numbers isolate PyMuPDF extraction cost.
+    Returns the page texts.
+    """
+
+    doc = fitz.open(pdf_path)
+
+    texts = [loader.extract_text(page, mode=mode) for page in doc]
+
+    doc.close()
+
+    return texts
+
+
+def extract_legacy(pdf_path):
+    """
+    The pre-extraction-mode reader: a fresh page.get_text("dict")
+    per page, spans joined by spaces. Ground truth for the modes.
+    """
+
+    doc = fitz.open(pdf_path)
+
+    texts = []
+
+    for page in doc:
+
+        lines = [
+            " ".join(span["text"] for span in line["spans"])
+            for block in page.get_text("dict")["blocks"]
+            for line in block.get("lines", ())
+        ]
+
+        texts.append(loader.normalize(" ".join(lines)))
+
+    doc.close()
+
+    return texts
+
+
+def bench_extract(paths):
+    """
+    Every mode, with and without reading-order sort, against the
+    legacy reader (raw get_text("dict")): speed and pages that differ.
+    """
+
+    modes = ["dict", "words", "text"]
+
+    default_sort = loader.SORT_READING_ORDER
+
+    for path in paths:
+
+        with fitz.open(path) as doc:
+            pages = len(doc)
+
+        print(f"\n{path} ({pages} pages)")
+
+        baseline, legacy = timed(extract_legacy, path)
+
+        print(
+            f"  legacy            {baseline:8.3f}s "
+            f"{1000 * baseline / max(pages, 1):7.2f} ms/page"
+        )
+
+        try:
+            for sort in (False, True):
+
+                loader.SORT_READING_ORDER = sort
+
+                for mode in modes:
+
+                    seconds, texts = timed(extract_all, path, mode)
+
+                    changed = sum(a != b for a, b in zip(texts, legacy))
+
+                    print(
+                        f"  {mode:<6} sort={sort!s:<5} {seconds:8.3f}s "
+                        f"{1000 * seconds / max(pages, 1):7.2f} ms/page "
+                        f"x{baseline / seconds:5.2f} "
+                        f"{changed}/{pages} pages differ from legacy"
+                    )
+        finally:
+            loader.SORT_READING_ORDER = default_sort
+
+
+# =====================================================
+# PARALLEL COMPARISON
+# =====================================================
+
+def synthetic_pair(sentences, seed=0):
+    """
+    A master and a revised copy: ~5% of sentences rewritten,
+    one block of clauses moved.
+    """
+
+    rnd = random.Random(seed)
+    vocab = [f"term{i}" for i in range(5000)] + [
+        "payment", "liability", "termination", "$1,000", "30%"
+    ]
+
+    def sentence():
+        words = [rnd.choice(vocab) for _ in range(rnd.randint(8, 20))]
+        return " ".join(words).capitalize() + "."
+
+    master = [sentence() for _ in range(sentences)]
+    test = master[:]
+
+    for _ in range(sentences // 20):
+        test[rnd.randrange(len(test))] = sentence()
+
+    block = test[sentences // 10:sentences // 10 + 20]
+    del test[sentences // 10:sentences // 10 + 20]
+    test[sentences // 2:sentences // 2] = block
+
+    return " ".join(master), " ".join(test)
+
+
+def bench_compare(args):
+    """
+    Serial smart_compare against the process-pool path at 1, 2 and
+    all cores: speedup and whether the output matches serial.
+    """
+
+    if args[0] == "--synthetic":
+        master_text, test_text = synthetic_pair(int(args[1]))
+    else:
+        master_text = "\n\n".join(loader.load_document(args[0]).values())
+        test_text = "\n\n".join(loader.load_document(args[1]).values())
+
+    cores = os.cpu_count() or 1
+
+    print(
+        f"\n{len(master_text.split())} / {len(test_text.split())} words, "
+        f"{cores} cores"
+    )
+
+    serial, expected = timed(
+        comparator.smart_compare, master_text, test_text, repeat=1
+    )
+
+    print(f"  serial             {serial:8.2f}s")
+
+    for workers in sorted({1, 2, cores}):
+
+        seconds, result = timed(
+            comparator.smart_compare, master_text, test_text,
+            workers=workers, repeat=1
+        )
+
+        print(
+            f"  parallel, {workers:<2} tasks {seconds:8.2f}s "
+            f"x{serial / seconds:5.2f} "
+            f"identical={result == expected}"
+        )
+
+
+# =====================================================
+# ENTRY POINT
+# =====================================================
+
+BENCHMARKS = {
+    "extract": bench_extract,
+    "compare": bench_compare,
+}
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 3 or sys.argv[1] not in BENCHMARKS:
+        print(__doc__)
+        sys.exit(1)
+
+    BENCHMARKS[sys.argv[1]](sys.argv[2:])
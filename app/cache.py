@@ -0,0 +1,68 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+# =====================================================
+# CONTENT HASH
+# =====================================================
+
+def content_hash(*parts):
+    """
+    sha256 over str / bytes parts (order matters).
+    """
+
+    h = hashlib.sha256()
+
+    for part in parts:
+
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+
+        h.update(len(part).to_bytes(8, "little"))
+        h.update(part)
+
+    return h.hexdigest()
+
+
+# =====================================================
+# THREAD-SAFE LRU
+# =====================================================
+
+class LRUCache:
+    """
+    Small process-wide memo table shared by all sessions.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+
+        with self._lock:
+
+            if key not in self._data:
+                return default
+
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+
+        with self._lock:
+
+            self._data[key] = value
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+
+        with self._lock:
+            self._data.clear()
@@ -98,11 +98,19 @@
 
 
 import re
-from rapidfuzz import fuzz
+import pickle
+from array import array
+from bisect import bisect_left, bisect_right
+from functools import cached_property
+from multiprocessing import shared_memory
+from rapidfuzz import fuzz, process
 from difflib import SequenceMatcher
 from nltk.tokenize import sent_tokenize
 import nltk
 
+from cache import LRUCache, content_hash
+from scheduler import get_scheduler
+
 nltk.download('punkt')
 nltk.download('punkt_tab')
 
@@ -129,9 +137,142 @@ def normalize(text):
 
 def split_sentences(text):
 
-    text = normalize(text)
+    return Tokenized(text).sentences
+
+
+# =====================================================
+# CANONICAL TOKENIZATION (one pass per document)
+# =====================================================
+
+token_pattern = re.compile(r'\S+')
+
+
+def canonical(word):
+    """
+    Per-token form of normalize(): " ".join(map(canonical, text.split()))
+    equals normalize(text).
+    """
+
+    word = word.lower()
+
+    word = word.replace("“", '"').replace("”", '"')
+    word = word.replace("’", "'")
+
+    return word
+
+
+class Tokenized:
+    """
+    A document tokenized once and shared by alignment, highlighting
+    and risk scoring:
+
+        words         raw tokens, as they appear in the text
+        starts/ends   char offset of each word (plus `offset`)
+        tokens        canonical (normalized) words
+        sentences     normalized sentence strings
+    """
+
+    def __init__(self, text, offset=0):
+
+        self.text = text
+        self.offset = offset
+
+        self.words = []
+        self.starts = array("Q")
+        self.ends = array("Q")
+
+        for match in token_pattern.finditer(text):
+            self.words.append(match.group())
+            self.starts.append(match.start() + offset)
+            self.ends.append(match.end() + offset)
+
+        self._features = {}
+
+    @cached_property
+    def tokens(self):
+        return [canonical(w) for w in self.words]
+
+    @cached_property
+    def normalized(self):
+        return " ".join(self.tokens)
+
+    @cached_property
+    def sentences(self):
+        return sent_tokenize(self.normalized)
+
+    @cached_property
+    def sentence_tokens(self):
+        """
+        (first token, end token) of every sentence.
+        """
+
+        norm_starts = []
+        pos = 0
+
+        for token in self.tokens:
+            norm_starts.append(pos)
+            pos += len(token) + 1
 
-    return sent_tokenize(text)
+        ranges = []
+        cursor = 0
+
+        for sentence in self.sentences:
+
+            pos = self.normalized.find(sentence, cursor)
+
+            if pos < 0:
+                pos = cursor
+
+            end = pos + len(sentence)
+
+            t1 = max(bisect_right(norm_starts, pos) - 1, 0)
+            t2 = max(bisect_left(norm_starts, end), t1 + 1)
+
+            ranges.append((t1, min(t2, len(self.words))))
+            cursor = end
+
+        return ranges
+
+    def sentence_span(self, i):
+        """
+        [start, end) char offsets of sentence i in the original text.
+        """
+
+        t1, t2 = self.sentence_tokens[i]
+
+        if t1 >= t2:
+            return [self.offset, self.offset]
+
+        return [self.starts[t1], self.ends[t2 - 1]]
+
+    def features(self, i):
+
+        if i not in self._features:
+            self._features[i] = sentence_features(self.sentences[i])
+
+        return self._features[i]
+
+    def slice(self, t1, t2):
+        """
+        Tokens [t1, t2) as a document of their own (t1 < t2), sharing
+        this one's tokenization instead of scanning the text again.
+        """
+
+        part = Tokenized.__new__(Tokenized)
+
+        part.offset = self.starts[t1]
+        part.text = self.text[
+            self.starts[t1] - self.offset:self.ends[t2 - 1] - self.offset
+        ]
+
+        part.words = self.words[t1:t2]
+        part.starts = self.starts[t1:t2]
+        part.ends = self.ends[t1:t2]
+        part.tokens = self.tokens[t1:t2]
+
+        part._features = {}
+
+        return part
 
 
 # =====================================================
@@ -149,33 +290,45 @@ def extract_numbers(text):
 # RISK ENGINE
 # =====================================================
 
-def risk_score(master, test):
+keywords = [
+    "liability",
+    "termination",
+    "penalty",
+    "confidential",
+    "payment",
+    "insurance"
+]
+
+
+def sentence_features(text):
+    """
+    Everything the risk rules look at, scanned once per sentence.
+    """
+
+    return (
+        frozenset(extract_numbers(text)),
+        frozenset(k for k in keywords if k in text)
+    )
+
+
+def risk_score(master, test, master_features=None, test_features=None):
+
+    master_nums, master_keys = master_features or sentence_features(master)
+    test_nums, test_keys = test_features or sentence_features(test)
 
     risk = 0
     reasons = []
 
-    master_nums = set(extract_numbers(master))
-    test_nums = set(extract_numbers(test))
-
     if master_nums != test_nums:
         risk += 5
         reasons.append("💰 Financial / numeric value changed")
 
-    keywords = [
-        "liability",
-        "termination",
-        "penalty",
-        "confidential",
-        "payment",
-        "insurance"
-    ]
-
     for k in keywords:
-        if k in master and k not in test:
+        if k in master_keys and k not in test_keys:
             risk += 3
             reasons.append(f"⚠ Clause removed: {k}")
 
-        if k not in master and k in test:
+        if k not in master_keys and k in test_keys:
             risk += 3
             reasons.append(f"⚠ Clause added: {k}")
 
@@ -188,15 +341,18 @@ def risk_score(master, test):
 
 def highlight(master, test):
 
-    matcher = SequenceMatcher(None, master.split(), test.split())
+    m_words = master.split()
+    t_words = test.split()
+
+    matcher = SequenceMatcher(None, m_words, t_words)
 
     m_out = []
     t_out = []
 
     for tag, i1, i2, j1, j2 in matcher.get_opcodes():
 
-        m_chunk = " ".join(master.split()[i1:i2])
-        t_chunk = " ".join(test.split()[j1:j2])
+        m_chunk = " ".join(m_words[i1:i2])
+        t_chunk = " ".join(t_words[j1:j2])
 
         if tag == "equal":
             m_out.append(m_chunk)
@@ -225,24 +381,59 @@ def highlight(master, test):
 
 
 # =====================================================
-# SMART COMPARATOR
+# SENTENCE ALIGNMENT
 # =====================================================
 
-def smart_compare(master_text, test_text):
+def align_sentences(master, test, best=None):
+    """
+    Greedy best-match alignment of two documents' sentences.
+
+    master / test are Tokenized documents or plain sequences of
+    normalized sentences. With Tokenized input each change record
+    also carries master_span / test_span (char offsets into the
+    original text).
+
+    best: optional (score, index) of every master sentence's best
+    match over all test sentences (see _best_matches). Taken when
+    that test sentence is still unused, else the row is scanned as
+    usual, so the result does not change.
+
+    Returns the list of change records (identical pairs skipped).
+    """
+
+    master_doc = master if isinstance(master, Tokenized) else None
+    test_doc = test if isinstance(test, Tokenized) else None
+
+    master_sent = master_doc.sentences if master_doc else master
+    test_sent = test_doc.sentences if test_doc else test
+
+    test_features = {}
 
-    master_sent = split_sentences(master_text)
-    test_sent = split_sentences(test_text)
+    def span(doc, i):
+        return doc.sentence_span(i) if doc and i is not None else None
 
     used = set()
     results = []
 
-    for m in master_sent:
+    for m_idx, m in enumerate(master_sent):
 
         best_score = 0
         best_match = None
         best_idx = None
 
-        for i, t in enumerate(test_sent):
+        candidates = test_sent
+
+        if best is not None:
+
+            score, i = best[m_idx]
+
+            if score <= 0:
+                candidates = ()   # nothing scores above 0
+            elif i not in used:
+                best_score, best_match, best_idx = score, test_sent[i], i
+                candidates = ()
+
+        for i, t in enumerate(candidates):
 
             if i in used:
                 continue
@@ -260,16 +451,30 @@ def smart_compare(master_text, test_text):
                 "master": m,
                 "test": "",
                 "risk": 4,
-                "reasons": ["Sentence removed"]
+                "reasons": ["Sentence removed"],
+                "master_span": span(master_doc, m_idx),
+                "test_span": None
             })
             continue
 
         used.add(best_idx)
 
-        if normalize(m) == normalize(best_match):
+        # sentences are already normalized
+        if m == best_match:
             continue  # identical → skip noise
 
-        risk, reasons = risk_score(m, best_match)
+        if best_idx not in test_features:
+            test_features[best_idx] = (
+                test_doc.features(best_idx) if test_doc
+                else sentence_features(best_match)
+            )
+
+        risk, reasons = risk_score(
+            m,
+            best_match,
+            master_doc.features(m_idx) if master_doc else None,
+            test_features[best_idx]
+        )
 
         if best_score > 90:
             change_type = "MODIFIED ⚠"
@@ -284,7 +489,9 @@ def smart_compare(master_text, test_text):
             "master": m_html,
             "test": t_html,
             "risk": risk,
-            "reasons": reasons
+            "reasons": reasons,
+            "master_span": span(master_doc, m_idx),
+            "test_span": span(test_doc, best_idx)
         })
 
     # detect added sentences
@@ -295,47 +502,351 @@ def smart_compare(master_text, test_text):
                 "master": "",
                 "test": f"<span style='background:#b3ffb3'>{t}</span>",
                 "risk": 4,
-                "reasons": ["New sentence added"]
+                "reasons": ["New sentence added"],
+                "master_span": None,
+                "test_span": span(test_doc, i)
             })
 
+    return results
 
 
+def build_result(results, master_html, test_html, moves=None):
 
-    # build full document highlight
-        master_html, test_html = full_document_highlight(
-            master_text,
-            test_text
+    total_risk = sum(r["risk"] for r in results)
+
+    all_reasons = list({
+        reason
+        for r in results
+        for reason in r["reasons"]
+    })
+
+    return {
+        "changes": sorted(results, key=lambda x: -x["risk"]),
+        "master_html": master_html,
+        "test_html": test_html,
+        "risk": total_risk,
+        "reasons": all_reasons,
+        "moves": moves or []
+    }
+
+
+# =====================================================
+# SECTION SPLITTER (Article IV, Section 5, 12.3 ...)
+# =====================================================
+
+# headings only count at the start of the text, a line, right after
+# the end of a sentence, or after an all-caps title of 4+ letters
+# (page text has no newlines: "ARTICLE IV DEFINITIONS 4.1 Scope";
+# acronyms like "USD 5." are too short), and must be followed by a
+# title-case word (or end the text): "Section 5 Payment", "ARTICLE IV",
+# "1. Term", "12.3 Fees" — but not "Section 5 shall survive termination."
+section_pattern = re.compile(
+    r'(?:^|(?<=\n)|(?<=[.;:!?]\s)|(?<=[A-Z]{4}\s))'
+    r'((?:Article|ARTICLE|Section|SECTION|Clause|CLAUSE)\s+'
+    r'(?:[IVXLCDM]+|\d+(?:\.\d+)*)'
+    r'|\d{1,3}(?:\.\d{1,3})+'
+    r'|\d{1,3}(?=\.))'
+    r'[.:]?(?=\s+(?:[-–—]\s+)?["“(]?[A-Z]|\s*$)'
+)
+
+SECTION_MATCH_THRESHOLD = 60
+SECTION_PREFIX_CHARS = 1000   # enough text to fingerprint a section
+
+
+def split_sections(doc):
+    """
+    Cut a Tokenized document into numbered sections, each a token
+    range of it (headings always start a token).
+    Text before the first heading becomes an unnumbered preamble.
+    """
+
+    text = doc.text
+    sections = []
+
+    starts = [m.start() for m in section_pattern.finditer(text)]
+
+    if not starts or starts[0] > 0:
+        starts.insert(0, 0)
+
+    starts.append(len(text))
+
+    for a, b in zip(starts, starts[1:]):
+
+        t1 = bisect_left(doc.starts, a + doc.offset)
+        t2 = bisect_left(doc.starts, b + doc.offset)
+
+        if t1 >= t2:
+            continue
+
+        part = doc.slice(t1, t2)
+
+        heading = section_pattern.match(part.text)
+        number = heading.group(1) if heading else ""
+
+        skip = len(heading.group(0).split()) if heading else 0
+
+        sections.append({
+            "number": " ".join(number.rstrip(".").split()),
+            "text": part.text,
+            "doc": part,
+            "body": " ".join(part.tokens[skip:])
+        })
+
+    return sections
+
+
+def _ordered(pairs):
+    """
+    Longest run of section pairs that keeps master order in the test.
+    Everything outside it was moved.
+    """
+
+    pairs = sorted(pairs)
+
+    tails = []      # index into pairs of smallest tail per length
+    prev = [None] * len(pairs)
+
+    for k, (_, j) in enumerate(pairs):
+
+        lo, hi = 0, len(tails)
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if pairs[tails[mid]][1] < j:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        prev[k] = tails[lo - 1] if lo else None
+
+        if lo == len(tails):
+            tails.append(k)
+        else:
+            tails[lo] = k
+
+    keep = set()
+    k = tails[-1] if tails else None
+
+    while k is not None:
+        keep.add(pairs[k])
+        k = prev[k]
+
+    return keep
+
+
+def align_sections(master_secs, test_secs):
+    """
+    Pair master and test sections.
+
+    1. identical body text (possibly renumbered / moved)
+    2. same section number with similar text
+    3. best similar section among the leftovers
+    """
+
+    pairs = {}
+    free = set(range(len(test_secs)))
+
+    by_body = {}
+    for j, t in enumerate(test_secs):
+        by_body.setdefault(t["body"], []).append(j)
+
+    for i, m in enumerate(master_secs):
+        candidates = by_body.get(m["body"])
+        if candidates:
+            j = candidates.pop(0)
+            pairs[i] = j
+            free.discard(j)
+
+    by_number = {}
+    for j in free:
+        if test_secs[j]["number"]:
+            by_number.setdefault(test_secs[j]["number"].lower(), j)
+
+    for i, m in enumerate(master_secs):
+
+        if i in pairs or not m["number"]:
+            continue
+
+        j = by_number.get(m["number"].lower())
+
+        if j is None or j not in free:
+            continue
+
+        score = fuzz.token_sort_ratio(
+            m["body"][:SECTION_PREFIX_CHARS],
+            test_secs[j]["body"][:SECTION_PREFIX_CHARS]
         )
 
-        total_risk = sum(r["risk"] for r in results)
+        if score >= SECTION_MATCH_THRESHOLD:
+            pairs[i] = j
+            free.discard(j)
+
+    for i, m in enumerate(master_secs):
 
-        all_reasons = list({
-            reason
-            for r in results
-            for reason in r["reasons"]
+        if i in pairs:
+            continue
+
+        best_score = SECTION_MATCH_THRESHOLD - 1
+        best_idx = None
+
+        for j in free:
+
+            score = fuzz.token_sort_ratio(
+                m["body"][:SECTION_PREFIX_CHARS],
+                test_secs[j]["body"][:SECTION_PREFIX_CHARS]
+            )
+
+            if score > best_score:
+                best_score = score
+                best_idx = j
+
+        if best_idx is not None:
+            pairs[i] = best_idx
+            free.discard(best_idx)
+
+    return pairs
+
+
+# =====================================================
+# SECTION-AWARE COMPARATOR
+# =====================================================
+
+def section_compare(master_text, test_text):
+    """
+    Align sections first, then sentences only inside matched sections.
+    """
+
+    # tokenized once; sections and the highlight share it
+    master = Tokenized(master_text)
+    test = Tokenized(test_text)
+
+    master_secs = split_sections(master)
+    test_secs = split_sections(test)
+
+    pairs = align_sections(master_secs, test_secs)
+    in_order = _ordered(pairs.items())
+
+    results = []
+    sections = []
+
+    for i, m in enumerate(master_secs):
+
+        label = m["number"] or "preamble"
+
+        if i not in pairs:
+            sections.append({"master": label, "test": None, "status": "removed"})
+            results.extend(align_sentences(m["doc"], []))
+            continue
+
+        j = pairs[i]
+        t = test_secs[j]
+        new_label = t["number"] or "preamble"
+
+        status = []
+
+        if (i, j) not in in_order:
+            status.append("moved")
+            results.append({
+                "type": "MOVED SECTION ↕",
+                "master": f"§ {label}",
+                "test": f"§ {new_label}",
+                "risk": 1,
+                "reasons": [f"↕ Section moved: {label}"]
+            })
+
+        if m["number"].lower() != t["number"].lower():
+            status.append("renumbered")
+            results.append({
+                "type": "RENUMBERED SECTION 🔢",
+                "master": f"§ {label}",
+                "test": f"§ {new_label}",
+                "risk": 1,
+                "reasons": [f"🔢 Section renumbered: {label} → {new_label}"]
+            })
+
+        sections.append({
+            "master": label,
+            "test": new_label,
+            "status": ", ".join(status) or "matched"
         })
 
-        return {
-            "changes": sorted(results, key=lambda x: -x["risk"]),
-            "master_html": master_html,
-            "test_html": test_html,
-            "risk": total_risk,
-            "reasons": all_reasons
-        }
+        if m["body"] == t["body"]:
+            continue
 
+        results.extend(align_sentences(m["doc"], t["doc"]))
 
+    matched = set(pairs.values())
+
+    for j, t in enumerate(test_secs):
+
+        if j in matched:
+            continue
+
+        sections.append({
+            "master": None,
+            "test": t["number"] or "preamble",
+            "status": "added"
+        })
+        results.extend(align_sentences([], t["doc"]))
+
+    # build full document highlight
+    master_html, test_html, moves = document_highlight(master, test)
+
+    result = build_result(results, master_html, test_html, moves)
+    result["sections"] = sections
+
+    return result
+
+
+# =====================================================
+# SMART COMPARATOR
+# =====================================================
+
+def smart_compare(master_text, test_text, mode="sentence", workers=None,
+                  ticket=None):
+    """
+    mode="sentence" → align all sentences globally
+    mode="section"  → align numbered sections, then sentences inside them
+
+    workers=N (sentence mode) → score sentences in N tasks on the
+    scheduler's process pool; output is identical to the serial path.
+    """
+
+    if mode == "section":
+        return section_compare(master_text, test_text)
+
+    if mode != "sentence":
+        raise ValueError(f"Unknown compare mode: {mode}")
+
+    if workers is not None:
+        return parallel_compare(master_text, test_text, workers, ticket)
+
+    # tokenized once, shared by every stage below
+    master = Tokenized(master_text)
+    test = Tokenized(test_text)
+
+    results = align_sentences(master, test)
+
+    # build full document highlight
+    master_html, test_html, moves = document_highlight(master, test)
+
+    return build_result(results, master_html, test_html, moves)
 
-def full_document_highlight(master_text, test_text):
 
-    matcher = SequenceMatcher(None, master_text.split(), test_text.split())
+
+def render_opcodes(opcodes, master_chunk, test_chunk):
+    """
+    Turn SequenceMatcher opcodes into two highlighted HTML strings.
+    master_chunk / test_chunk map a token range (i1, i2) to its text.
+    """
 
     master_out = []
     test_out = []
 
-    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+    for tag, i1, i2, j1, j2 in opcodes:
 
-        m_chunk = " ".join(master_text.split()[i1:i2])
-        t_chunk = " ".join(test_text.split()[j1:j2])
+        m_chunk = master_chunk(i1, i2)
+        t_chunk = test_chunk(j1, j2)
 
         if tag == "equal":
             master_out.append(m_chunk)
@@ -361,3 +872,607 @@ def full_document_highlight(master_text, test_text):
             )
 
     return " ".join(master_out), " ".join(test_out)
+
+
+# =====================================================
+# BLOCK-MOVE DETECTION
+# =====================================================
+
+MOVE_SHINGLE = 8       # tokens per anchor shingle
+MIN_MOVE_TOKENS = 12   # shorter relocated runs are diffed normally
+MOVE_HASH_SLICE = 100_000   # shingles per hash dict (bounds memory)
+
+
+_HASH_MOD = (1 << 61) - 1
+_HASH_BASE = 1_000_003
+
+
+def _shingle_hashes(seq, k):
+    """
+    Rolling hash of every k-token window, as array('Q').
+    Tokens may be strings or ints (TextStore token ids).
+    """
+
+    hashes = array("Q")
+
+    if len(seq) < k:
+        return hashes
+
+    top = pow(_HASH_BASE, k - 1, _HASH_MOD)
+    values = [hash(token) % _HASH_MOD for token in seq[:k]]
+
+    h = 0
+    for v in values:
+        h = (h * _HASH_BASE + v) % _HASH_MOD
+
+    hashes.append(h)
+
+    for i in range(k, len(seq)):
+        h = (h - (hash(seq[i - k]) % _HASH_MOD) * top) % _HASH_MOD
+        h = (h * _HASH_BASE + hash(seq[i]) % _HASH_MOD) % _HASH_MOD
+        hashes.append(h)
+
+    return hashes
+
+
+def _unique_shingles(hashes, parts, part, only=None):
+    """
+    hash → start index, for shingles of one hash slice
+    (h % parts == part) that occur exactly once (-1 for repeated
+    ones). With `only`, hashes outside it are not recorded at all.
+    """
+
+    seen = {}
+
+    for i, h in enumerate(hashes):
+
+        if h % parts != part:
+            continue
+
+        if only is not None and only.get(h, -1) < 0:
+            continue
+
+        seen[h] = -1 if h in seen else i
+
+    return seen
+
+
+def _anchor_table(a_hashes, b_hashes):
+    """
+    anchor[i] = j where shingle i of a and shingle j of b share a hash
+    that occurs exactly once on each side, -1 elsewhere.
+
+    The hash space is handled in slices so the dicts never hold more
+    than MOVE_HASH_SLICE shingles at a time.
+    """
+
+    anchor = array("q", [-1]) * len(a_hashes)
+    parts = len(b_hashes) // MOVE_HASH_SLICE + 1
+
+    for part in range(parts):
+
+        unique_b = _unique_shingles(b_hashes, parts, part)
+        unique_a = _unique_shingles(a_hashes, parts, part, only=unique_b)
+
+        for h, i in unique_a.items():
+            if i >= 0:
+                anchor[i] = unique_b[h]
+
+    return anchor
+
+
+def _overlaps(starts, ends, lo, hi):
+
+    pos = bisect_left(starts, lo)
+
+    if pos and ends[pos - 1] > lo:
+        return True
+
+    return pos < len(starts) and starts[pos] < hi
+
+
+def detect_moves(a, b):
+    """
+    Find blocks of `a` that reappear in `b` out of order.
+
+    Shingles unique to both sequences act as anchors; adjacent anchors
+    merge into matching blocks. The heaviest chain of blocks that keeps
+    its order is the document's backbone; every other block of at least
+    MIN_MOVE_TOKENS tokens is reported as a move.
+    """
+
+    if len(a) < MIN_MOVE_TOKENS or len(b) < MIN_MOVE_TOKENS:
+        return []
+
+    k = MOVE_SHINGLE
+
+    # shingles as int hashes in arrays, no per-position tuples
+    # (TextStore token-id arrays can be 1M+ long)
+    anchor = _anchor_table(_shingle_hashes(a, k), _shingle_hashes(b, k))
+
+    # merge diagonal anchor runs into maximal blocks
+    blocks = []
+
+    for i, j in enumerate(anchor):
+
+        if j < 0:
+            continue
+
+        # hash collision
+        if a[i:i + k] != b[j:j + k]:
+            continue
+
+        if blocks:
+            bi, bj, length = blocks[-1]
+            if i - bi == j - bj and i <= bi + length - k + 1:
+                blocks[-1] = (bi, bj, i - bi + k)
+                continue
+
+        blocks.append((i, j, k))
+
+    # keep blocks disjoint on both sides, longest first
+    a_starts, a_ends, b_starts, b_ends = [], [], [], []
+    kept = []
+
+    for i, j, length in sorted(blocks, key=lambda x: -x[2]):
+
+        if _overlaps(a_starts, a_ends, i, i + length):
+            continue
+        if _overlaps(b_starts, b_ends, j, j + length):
+            continue
+
+        pos = bisect_left(a_starts, i)
+        a_starts.insert(pos, i)
+        a_ends.insert(pos, i + length)
+
+        pos = bisect_left(b_starts, j)
+        b_starts.insert(pos, j)
+        b_ends.insert(pos, j + length)
+
+        kept.append((i, j, length))
+
+    kept.sort()
+
+    # heaviest increasing chain by test position (Fenwick prefix max)
+    ranks = {j: r + 1 for r, j in enumerate(sorted(j for _, j, _ in kept))}
+    tree = [(0, -1)] * (len(kept) + 1)
+    parent = [-1] * len(kept)
+    best = (0, -1)
+
+    for idx, (i, j, length) in enumerate(kept):
+
+        r = ranks[j] - 1
+        prev = (0, -1)
+
+        while r > 0:
+            prev = max(prev, tree[r])
+            r -= r & -r
+
+        score = (prev[0] + length, idx)
+        parent[idx] = prev[1]
+        best = max(best, score)
+
+        r = ranks[j]
+        while r < len(tree):
+            tree[r] = max(tree[r], score)
+            r += r & -r
+
+    in_order = set()
+    idx = best[1]
+
+    while idx >= 0:
+        in_order.add(idx)
+        idx = parent[idx]
+
+    return [
+        {
+            "master_start": i,
+            "master_end": i + length,
+            "test_start": j,
+            "test_end": j + length,
+            "tokens": length
+        }
+        for idx, (i, j, length) in enumerate(kept)
+        if idx not in in_order and length >= MIN_MOVE_TOKENS
+    ]
+
+
+def _mask(seq, ranges, side):
+    """
+    Collapse each moved range to one sentinel that matches nothing.
+    Returns (keys, bounds): keys[p] covers original tokens
+    [bounds[p], bounds[p + 1]).
+    """
+
+    keys = []
+    bounds = array("q")
+    starts = {start: (n, end) for n, (start, end) in enumerate(ranges)}
+
+    i = 0
+
+    while i < len(seq):
+
+        bounds.append(i)
+
+        if i in starts:
+            n, end = starts[i]
+            keys.append((side, n))
+            i = end
+        else:
+            keys.append(seq[i])
+            i += 1
+
+    bounds.append(len(seq))
+
+    return keys, bounds
+
+
+def _masked_chunk(bounds, chunk, moved):
+    """
+    chunk() for masked positions: plain runs map back to their
+    original token range, moved blocks render in the move colour.
+    """
+
+    def render(p1, p2):
+
+        out = []
+        run = None
+
+        for p in range(p1, p2):
+
+            start, end = bounds[p], bounds[p + 1]
+
+            if start in moved:
+
+                if run:
+                    out.append(chunk(*run))
+                    run = None
+
+                out.append(
+                    f"<span style='background:#cce0ff' "
+                    f"title='Moved block {moved[start]}'>"
+                    f"{chunk(start, end)}</span>"
+                )
+
+            elif run:
+                run = (run[0], end)
+
+            else:
+                run = (start, end)
+
+        if run:
+            out.append(chunk(*run))
+
+        return " ".join(out)
+
+    return render
+
+
+def highlight_tokens(a, b, master_chunk, test_chunk):
+    """
+    Full-document diff over two token sequences with move detection.
+    Returns (master_html, test_html, moves); moves use token offsets.
+    """
+
+    moves = detect_moves(a, b)
+
+    if not moves:
+        matcher = SequenceMatcher(None, a, b)
+        return (*render_opcodes(
+            matcher.get_opcodes(), master_chunk, test_chunk
+        ), [])
+
+    a_keys, a_bounds = _mask(
+        a, [(m["master_start"], m["master_end"]) for m in moves], "src"
+    )
+
+    by_test = sorted(range(len(moves)), key=lambda n: moves[n]["test_start"])
+    b_ranges = {n: (moves[n]["test_start"], moves[n]["test_end"]) for n in by_test}
+
+    b_keys, b_bounds = _mask(b, [b_ranges[n] for n in by_test], "dst")
+
+    # residual edits only: moved blocks are single tokens now
+    matcher = SequenceMatcher(None, a_keys, b_keys)
+
+    master_html, test_html = render_opcodes(
+        matcher.get_opcodes(),
+        _masked_chunk(
+            a_bounds, master_chunk,
+            {m["master_start"]: n + 1 for n, m in enumerate(moves)}
+        ),
+        _masked_chunk(
+            b_bounds, test_chunk,
+            {m["test_start"]: n + 1 for n, m in enumerate(moves)}
+        )
+    )
+
+    return master_html, test_html, moves
+
+
+def document_highlight(master, test):
+    """
+    Full-document highlight of two Tokenized documents.
+    Moves get master_chars / test_chars offsets into the original text.
+    """
+
+    m_words = master.words
+    t_words = test.words
+
+    master_html, test_html, moves = highlight_tokens(
+        m_words,
+        t_words,
+        lambda i1, i2: " ".join(m_words[i1:i2]),
+        lambda j1, j2: " ".join(t_words[j1:j2])
+    )
+
+    for move in moves:
+        move["master_chars"] = [
+            master.starts[move["master_start"]],
+            master.ends[move["master_end"] - 1]
+        ]
+        move["test_chars"] = [
+            test.starts[move["test_start"]],
+            test.ends[move["test_end"] - 1]
+        ]
+
+    return master_html, test_html, moves
+
+
+def full_document_highlight(master_text, test_text):
+
+    return document_highlight(Tokenized(master_text), Tokenized(test_text))
+
+
+# =====================================================
+# PARALLEL COMPARATOR (exact)
+# =====================================================
+
+TASKS_PER_WORKER = 4    # batches per process, for load balancing
+WORDS_PER_PAGE = 500    # rough page count for scheduler priority
+
+# test documents a compare process keeps, by shared-memory name
+_shared_tests = LRUCache(2)
+
+
+def _best_matches(masters, tests):
+    """
+    (score, index) of each master sentence's best test sentence over
+    the whole test document, first index on ties, i.e. what the
+    serial scan picks while nothing is used yet. extractOne prunes
+    candidates that cannot win.
+    """
+
+    out = []
+
+    for m in masters:
+
+        # no processor: score the normalized text as the scan does
+        best = process.extractOne(
+            m, tests, scorer=fuzz.token_sort_ratio, processor=None
+        )
+
+        out.append((best[1], best[2]) if best else (0, None))
+
+    return out
+
+
+def _best_matches_shared(masters, name):
+    """
+    _best_matches in a compare process, with the test sentences read
+    from shared memory once per process instead of sent with every
+    task.
+    """
+
+    tests = _shared_tests.get(name)
+
+    if tests is None:
+
+        block = shared_memory.SharedMemory(name=name)
+
+        try:
+            tests = pickle.loads(block.buf)
+        finally:
+            block.close()
+
+        _shared_tests.put(name, tests)
+
+    return _best_matches(masters, tests)
+
+
+def parallel_compare(master_text, test_text, workers, ticket=None):
+    """
+    smart_compare with sentence scoring spread over `workers` tasks
+    on the scheduler's shared process pool.
+
+    Output is identical to the serial path: workers only find each
+    sentence's best match; the greedy pass (re-scanning serially when
+    that match is already taken) and the full-document highlight run
+    here, unchanged.
+    """
+
+    master = Tokenized(master_text)
+    test = Tokenized(test_text)
+
+    sentences = master.sentences
+    tests = test.sentences
+
+    if workers > 1 and sentences:
+
+        size = -(-len(sentences) // (workers * TASKS_PER_WORKER))
+        pages = (len(master.words) + len(test.words)) // WORDS_PER_PAGE
+
+        data = pickle.dumps(tests, pickle.HIGHEST_PROTOCOL)
+
+        block = shared_memory.SharedMemory(create=True, size=len(data))
+        block.buf[:len(data)] = data
+
+        try:
+            with get_scheduler().job(pages, ticket) as job:
+
+                futures = [
+                    job.submit_process(
+                        _best_matches_shared,
+                        sentences[k:k + size], block.name
+                    )
+                    for k in range(0, len(sentences), size)
+                ]
+
+                best = [match for f in futures for match in f.result()]
+
+        finally:
+            # the job has waited for its tasks by now
+            block.close()
+            block.unlink()
+
+    else:
+        best = _best_matches(sentences, tests)
+
+    results = align_sentences(master, test, best)
+
+    # build full document highlight
+    master_html, test_html, moves = document_highlight(master, test)
+
+    return build_result(results, master_html, test_html, moves)
+
+
+# =====================================================
+# INCREMENTAL COMPARATOR (page-level memo)
+# =====================================================
+
+PAGE_RESULT_CACHE_SIZE = 20000   # page pairs, shared by all sessions
+
+page_result_cache = LRUCache(PAGE_RESULT_CACHE_SIZE)
+
+
+def compare_page_pair(m, t):
+    """
+    Changes + highlight for one master/test page pair, memoized on
+    the hashes of both page texts.
+    """
+
+    key = (content_hash(m), content_hash(t))
+
+    cached = page_result_cache.get(key)
+
+    if cached is not None:
+        return cached, True
+
+    m_doc = Tokenized(m)
+    t_doc = Tokenized(t)
+
+    results = align_sentences(m_doc, t_doc)
+
+    m_html, t_html, moves = document_highlight(m_doc, t_doc)
+
+    page_result_cache.put(key, (results, m_html, t_html, moves))
+
+    return (results, m_html, t_html, moves), False
+
+
+def incremental_compare(master_pages, test_pages):
+    """
+    Compare page dicts page by page so that unchanged pages of a new
+    revision reuse earlier results.
+
+    Pages are paired by diffing the two page-hash sequences: identical
+    pages pair up even when pages were inserted or removed, changed
+    pages pair positionally inside each replaced run.
+    """
+
+    m_pages = list(master_pages.items())
+    t_pages = list(test_pages.items())
+
+    matcher = SequenceMatcher(
+        None,
+        [content_hash(text) for _, text in m_pages],
+        [content_hash(text) for _, text in t_pages],
+        autojunk=False
+    )
+
+    pairs = []
+
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+
+        m_run = m_pages[i1:i2]
+        t_run = t_pages[j1:j2]
+
+        for k in range(max(len(m_run), len(t_run))):
+            pairs.append((
+                m_run[k] if k < len(m_run) else (None, ""),
+                t_run[k] if k < len(t_run) else (None, "")
+            ))
+
+    results = []
+    master_out = []
+    test_out = []
+    reused = []
+    compared = []
+    page_moves = []
+
+    for (m_num, m), (t_num, t) in pairs:
+
+        (page_results, m_html, t_html, moves), hit = compare_page_pair(m, t)
+
+        results.extend(dict(r) for r in page_results)
+
+        page_moves.extend(
+            {"master_page": m_num, "test_page": t_num, **move}
+            for move in moves
+        )
+
+        if m_html:
+            master_out.append(m_html)
+        if t_html:
+            test_out.append(t_html)
+
+        (reused if hit else compared).append({
+            "master_page": m_num,
+            "test_page": t_num
+        })
+
+    result = build_result(
+        results,
+        " ".join(master_out),
+        " ".join(test_out),
+        page_moves
+    )
+
+    result["reused"] = {
+        "pages_reused": reused,
+        "pages_compared": compared
+    }
+
+    return result
+
+
+# =====================================================
+# LOW-MEMORY COMPARATOR (TextStore input)
+# =====================================================
+
+def store_compare(master_store, test_store):
+    """
+    Same output as smart_compare, but reads both documents from
+    sealed TextStores: sentences are rebuilt from the stores' token
+    ids (each distinct token canonicalized once, in the shared
+    vocabulary) and the full-document diff runs over the id arrays.
+
+    The test side is scanned once per master sentence, so it is
+    built once up front (one copy of its text) rather than on
+    every pair.
+    """
+
+    canon = master_store.vocab.table(canonical)
+
+    results = align_sentences(
+        master_store.sentences(token_text=canon),
+        list(test_store.sentences(token_text=canon))
+    )
+
+    master_html, test_html, moves = highlight_tokens(
+        master_store.token_ids,
+        test_store.token_ids,
+        master_store.span_text,
+        test_store.span_text
+    )
+
+    return build_result(results, master_html, test_html, moves)
@@ -1,12 +1,16 @@
 import fitz
 import io
+import os
 import shutil
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import deque
 from PIL import Image
 import pytesseract
 from docx import Document
 
+from cache import LRUCache, content_hash
+from scheduler import get_scheduler
+
 
 # =====================================================
 # CONFIG
@@ -14,7 +18,42 @@ from docx import Document
 
 MIN_TEXT_THRESHOLD = 40
 OCR_DPI = 300
-MAX_WORKERS = 4   # increase if CPU is strong (6–8 ideal)
+
+# "text"  → plain text, cheapest PyMuPDF output (1-2.5x faster)
+# "words" → word tuples, joined in reading order
+# "dict"  → full font/bbox/span tree (legacy default)
+#
+# "text"/"words" do not put a space between spans of one line, so
+# their output differs from "dict" and shifts existing comparisons.
+# Run `python bench.py extract` on your own PDFs before switching.
+EXTRACTION_MODE = "dict"
+
+# the flags page.get_text() itself uses for each output (ligatures,
+# whitespace, mediabox clip), so a shared TextPage reads the same text
+TEXTPAGE_FLAGS = {
+    "text": fitz.TEXTFLAGS_TEXT,
+    "words": fitz.TEXTFLAGS_WORDS,
+    "dict": fitz.TEXTFLAGS_DICT,
+}
+
+# re-sort blocks top-left → bottom-right; changes text order and
+# makes "text" mode 3-11x slower, so it is off by default
+SORT_READING_ORDER = False
+
+# "hybrid" → OCR only image regions lacking a text layer, on pages
+#            that are mostly image or have sparse native text
+# "page"   → legacy whole-page OCR when the page is sparse
+#
+# hybrid adds OCR text to mixed pages the legacy path left alone;
+# benchmark it on your own documents before switching.
+OCR_MODE = "page"
+OCR_MIN_DPI = 150
+OCR_MAX_DPI = 400
+OCR_TARGET_PIXELS = 8_000_000   # ≈ full A4 page at 300 DPI
+OCR_MIN_REGION = 0.02           # ignore images under 2% of the page (logos)
+OCR_IMAGE_SHARE = 0.5           # regions covering this much → image page
+
+EXTRACTION_CACHE_SIZE = 5000    # pages, shared by all sessions
 
 logging.basicConfig(
     level=logging.INFO,
@@ -23,6 +62,8 @@ logging.basicConfig(
 
 logger = logging.getLogger("loader")
 
+extraction_cache = LRUCache(EXTRACTION_CACHE_SIZE)
+
 
 # =====================================================
 # TESSERACT AUTO-DETECT
@@ -38,6 +79,9 @@ if tesseract_path is None:
 else:
     pytesseract.pytesseract.tesseract_cmd = tesseract_path
 
+# tesseract's own OpenMP threads would multiply the scheduler's OCR slots
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
 
 # =====================================================
 # TEXT NORMALIZER
@@ -64,60 +108,363 @@ def normalize(text: str) -> str:
 # OCR ENGINE
 # =====================================================
 
-def ocr_page(page):
+def ocr_page(page, clip=None, dpi=None):
     """
-    Convert PDF page → image → OCR
+    Convert PDF page (or a clipped region of it) → image → OCR
     """
 
-    pix = page.get_pixmap(dpi=OCR_DPI)
+    # read at call time so runtime changes to OCR_DPI apply
+    pix = page.get_pixmap(dpi=dpi or OCR_DPI, clip=clip)
 
     img = Image.open(io.BytesIO(pix.tobytes("png")))
 
-    text = pytesseract.image_to_string(
-        img,
-        config="--oem 3 --psm 6"
+    # global cap on concurrent tesseract processes (all sessions)
+    with get_scheduler().ocr:
+        text = pytesseract.image_to_string(
+            img,
+            config="--oem 3 --psm 6"
+        )
+
+    return normalize(text)
+
+
+# =====================================================
+# TEXT EXTRACTION
+# =====================================================
+
+def text_page(page, mode=None):
+    """
+    TextPage built with the flags page.get_text(mode) would use.
+    """
+
+    mode = mode or EXTRACTION_MODE
+
+    if mode not in TEXTPAGE_FLAGS:
+        raise ValueError(f"Unknown extraction mode: {mode}")
+
+    return page.get_textpage(flags=TEXTPAGE_FLAGS[mode])
+
+
+def text_pieces(page, textpage=None, mode=None):
+    """
+    The native text layer as [(rect, text)] in extraction order:
+    lines ("dict"), words ("words") or text blocks ("text").
+    Joined, they give extract_text()'s output.
+    """
+
+    mode = mode or EXTRACTION_MODE
+
+    if textpage is None:
+        textpage = text_page(page, mode)
+
+    if mode == "text":
+        blocks = page.get_text(
+            "blocks",
+            textpage=textpage,
+            sort=SORT_READING_ORDER
+        )
+        return [(fitz.Rect(b[:4]), b[4]) for b in blocks if b[6] == 0]
+
+    if mode == "words":
+        words = page.get_text(
+            "words",
+            textpage=textpage,
+            sort=SORT_READING_ORDER
+        )
+        return [(fitz.Rect(w[:4]), w[4]) for w in words]
+
+    data = page.get_text(
+        "dict",
+        textpage=textpage,
+        sort=SORT_READING_ORDER
     )
 
+    return [
+        (
+            fitz.Rect(line["bbox"]),
+            " ".join(span["text"] for span in line["spans"])
+        )
+        for block in data["blocks"] if "lines" in block
+        for line in block["lines"]
+    ]
+
+
+def extract_text(page, textpage=None, mode=None):
+    """
+    Pull the native text layer of a page.
+
+    All modes read from one TextPage (see text_page), so the page is
+    only parsed once even when callers need several outputs from it.
+    """
+
+    mode = mode or EXTRACTION_MODE
+
+    if textpage is None:
+        textpage = text_page(page, mode)
+
+    if mode == "text":
+        text = page.get_text(
+            "text",
+            textpage=textpage,
+            sort=SORT_READING_ORDER
+        )
+
+    else:
+        text = " ".join(t for _, t in text_pieces(page, textpage, mode))
+
     return normalize(text)
 
 
+# =====================================================
+# HYBRID OCR (IMAGE REGIONS ONLY)
+# =====================================================
+
+def region_dpi(rect, native_dpi=None):
+    """
+    Pick a render resolution for a clipped region.
+
+    Small regions (signatures, stamps) get more DPI, large scans less,
+    so every region costs roughly OCR_TARGET_PIXELS. Never render far
+    above the embedded image's own resolution.
+    """
+
+    area_inch = (rect.width / 72) * (rect.height / 72)
+
+    if area_inch <= 0:
+        return OCR_MIN_DPI
+
+    dpi = (OCR_TARGET_PIXELS / area_inch) ** 0.5
+
+    if native_dpi:
+        dpi = min(dpi, max(native_dpi, OCR_MIN_DPI))
+
+    return int(min(max(dpi, OCR_MIN_DPI), OCR_MAX_DPI))
+
+
+def image_regions(page, pieces):
+    """
+    Image areas of the page that carry no usable text layer.
+
+    Returns a list of (rect, dpi).
+    """
+
+    page_area = abs(page.rect)
+    regions = []
+
+    for info in page.get_image_info():
+
+        rect = fitz.Rect(info["bbox"]) & page.rect
+
+        if rect.is_empty or abs(rect) < OCR_MIN_REGION * page_area:
+            continue
+
+        # scanned pages with an OCR layer already have text here
+        native = sum(
+            len(text.strip())
+            for piece, text in pieces
+            if rect.contains(piece.tl)
+        )
+
+        if native >= MIN_TEXT_THRESHOLD:
+            continue
+
+        native_dpi = None
+        if rect.width:
+            native_dpi = info["width"] / (rect.width / 72)
+
+        regions.append((rect, region_dpi(rect, native_dpi)))
+
+    return regions
+
+
+def hybrid_page_text(page, textpage, page_number):
+    """
+    Native text layer + OCR of image regions that lack one, for pages
+    that are mostly image or carry too little native text. OCR text
+    goes in before the first native piece below it; native text keeps
+    its extract_text() order.
+
+    Returns None when the page needs no region OCR (e.g. a text page
+    with a logo), so it is extracted as usual.
+    """
+
+    # resource listing only: text-only pages skip the image device pass
+    if not page.get_images():
+        return None
+
+    pieces = text_pieces(page, textpage)
+
+    regions = image_regions(page, pieces)
+
+    if not regions:
+        return None
+
+    native = normalize(" ".join(text for _, text in pieces))
+    covered = sum(abs(rect) for rect, _ in regions)
+
+    if (
+        len(native) >= MIN_TEXT_THRESHOLD
+        and covered < OCR_IMAGE_SHARE * abs(page.rect)
+    ):
+        return None
+
+    logger.info(
+        f"Region OCR → page {page_number+1} ({len(regions)} regions)"
+    )
+
+    # drop stray text that the region OCR will re-read
+    merged = [
+        (rect, text) for rect, text in pieces
+        if not any(region.contains(rect.tl) for region, _ in regions)
+    ]
+
+    for region, dpi in sorted(regions, key=lambda r: (r[0].y0, r[0].x0)):
+
+        at = next(
+            (
+                n for n, (rect, _) in enumerate(merged)
+                if (rect.y0, rect.x0) > (region.y0, region.x0)
+            ),
+            len(merged)
+        )
+
+        merged.insert(at, (region, ocr_page(page, region, dpi)))
+
+    return normalize(" ".join(text for _, text in merged))
+
+
+# =====================================================
+# PAGE CONTENT HASH
+# =====================================================
+
+def _referenced_stream(doc, xref, key):
+    """
+    Raw stream of the object that `key` of object `xref` points to.
+    """
+
+    kind, value = doc.xref_get_key(xref, key)
+
+    if kind != "xref":
+        return b""
+
+    return doc.xref_stream_raw(int(value.split()[0])) or b""
+
+
+def extraction_settings():
+    """
+    Every setting extract_page reads; a change must miss the cache.
+    """
+
+    return (
+        EXTRACTION_MODE, SORT_READING_ORDER, MIN_TEXT_THRESHOLD,
+        OCR_MODE, OCR_DPI, OCR_MIN_DPI, OCR_MAX_DPI,
+        OCR_TARGET_PIXELS, OCR_MIN_REGION, OCR_IMAGE_SHARE
+    )
+
+
+def page_hash(doc, page):
+    """
+    Fingerprint of what a page draws: content stream, Form XObject
+    streams (text drawn inside forms), embedded images, fonts with
+    their encodings and ToUnicode maps, plus the settings that shape
+    extracted text. Identical pages across revisions get identical
+    hashes.
+    """
+
+    parts = [
+        repr(extraction_settings()),
+        repr(tuple(page.rect)), str(page.rotation),
+        page.read_contents()
+    ]
+
+    # nested forms included (their invoker is another form)
+    for xobject in page.get_xobjects():
+        parts.append(doc.xref_stream_raw(xobject[0]) or b"")
+
+    for font in page.get_fonts():
+        parts.append(repr(font[1:]))
+
+        if font[0]:
+            parts.append(doc.xref_object(font[0], compressed=True))
+            parts.append(_referenced_stream(doc, font[0], "ToUnicode"))
+
+            # /Differences arrays live in a separate encoding object
+            kind, value = doc.xref_get_key(font[0], "Encoding")
+            if kind == "xref":
+                parts.append(
+                    doc.xref_object(int(value.split()[0]), compressed=True)
+                )
+
+    for image in page.get_images():
+        parts.append(doc.xref_stream_raw(image[0]) or b"")
+
+    return content_hash(*parts)
+
+
 # =====================================================
 # PAGE PROCESSOR (PARALLEL READY)
 # =====================================================
 
-def process_page(doc, page_number):
+def process_page(doc, page_number, stats=None, cache=True):
     """
     Extract text from a single page.
     Designed for parallel execution.
+    Pages seen before (same content hash) come from the cache;
+    cache=False still reads it but never adds to it.
     """
 
     page = doc.load_page(page_number)
 
-    blocks = []
-    data = page.get_text("dict")
+    key = page_hash(doc, page)
+    text = extraction_cache.get(key)
 
-    for block in data["blocks"]:
-        if "lines" in block:
-            for line in block["lines"]:
-                blocks.append(
-                    " ".join(span["text"] for span in line["spans"])
-                )
+    if text is not None:
+        if stats is not None:
+            stats.setdefault("cached_pages", []).append(page_number + 1)
+        return page_number + 1, text
 
-    text = normalize(" ".join(blocks))
+    text = extract_page(page, page_number)
+
+    if cache:
+        extraction_cache.put(key, text)
+
+    return page_number + 1, text
+
+
+def extract_page(page, page_number):
+
+    textpage = text_page(page)
+
+    if OCR_MODE == "hybrid":
+        text = hybrid_page_text(page, textpage, page_number)
+
+        # image regions were OCRed already; a whole-page pass
+        # would read the same pixels again
+        if text is not None:
+            return text
+
+    text = extract_text(page, textpage)
 
     # OCR fallback
     if len(text) < MIN_TEXT_THRESHOLD:
         logger.info(f"OCR triggered → page {page_number+1}")
         text = ocr_page(page)
 
-    return page_number + 1, text
+    return text
 
 
 # =====================================================
 # FAST PDF READER (PARALLEL)
 # =====================================================
 
-def read_pdf(pdf_path):
+def iter_pdf(pdf_path, stats=None, ticket=None, cache=True):
+    """
+    Yield (page_number, text) in page order while pages are
+    extracted in parallel, so callers can stream pages out.
+
+    Pages run on the process-wide scheduler, shared with every
+    other session, instead of a private thread pool.
+    """
 
     logger.info("Opening PDF...")
 
@@ -125,25 +472,26 @@ def read_pdf(pdf_path):
     total_pages = len(doc)
 
     logger.info(f"Total pages: {total_pages}")
-    logger.info(f"Using {MAX_WORKERS} CPU threads")
 
-    pages = {}
+    try:
+        with get_scheduler().job(total_pages, ticket) as job:
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = deque(
+                job.submit(process_page, doc, i, stats, cache)
+                for i in range(total_pages)
+            )
 
-        futures = [
-            executor.submit(process_page, doc, i)
-            for i in range(total_pages)
-        ]
+            # drop each page once yielded so consumers can stream
+            while futures:
+                yield futures.popleft().result()
 
-        for future in as_completed(futures):
-            page_num, text = future.result()
-            pages[page_num] = text
+    finally:
+        doc.close()
 
-    doc.close()
 
-    # ensure correct order
-    return dict(sorted(pages.items()))
+def read_pdf(pdf_path, stats=None, ticket=None):
+
+    return dict(iter_pdf(pdf_path, stats, ticket))
 
 
 # =====================================================
@@ -177,17 +525,48 @@ def read_docx(docx_path):
 # MASTER LOADER
 # =====================================================
 
-def load_document(path):
+def load_document(path, stats=None, ticket=None):
 
     logger.info(f"Loading document: {path}")
 
     lower = path.lower()
 
     if lower.endswith(".pdf"):
-        return read_pdf(path)
+        return read_pdf(path, stats, ticket)
 
     elif lower.endswith(".docx"):
         return read_docx(path)
 
     else:
         raise ValueError("Unsupported file type. Only PDF/DOCX allowed.")
+
+
+
+# =====================================================
+# LOW-MEMORY LOADER
+# =====================================================
+
+def load_into_store(path, store, ticket=None):
+    """
+    Stream a document's pages into a TextStore instead of
+    holding them in a dict, then seal the store.
+
+    Pages are not added to the extraction cache, which would
+    otherwise keep the whole document in memory after streaming.
+    """
+
+    logger.info(f"Loading document (low memory): {path}")
+
+    lower = path.lower()
+
+    if lower.endswith(".pdf"):
+        for _, text in iter_pdf(path, ticket=ticket, cache=False):
+            store.add_page(text)
+
+    elif lower.endswith(".docx"):
+        store.add_page(read_docx(path)[1])
+
+    else:
+        raise ValueError("Unsupported file type. Only PDF/DOCX allowed.")
+
+    return store.seal()
@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+import comparator
+import loader
+import textstore
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+
+RESULTS_DB = os.path.join("library", "results.db")
+
+# describe one run (memory used, pages re-compared), not the
+# comparison itself, so they are never stored or replayed
+RUN_FIELDS = ("peak_rss_mb", "reused", "from_store")
+
+logger = logging.getLogger("results")
+
+
+# =====================================================
+# ENGINE VERSION
+# =====================================================
+
+def engine_version():
+    """
+    Hash of the code that produces a result (alignment, rules,
+    extraction). It is part of the cache key, so after any edit to
+    these modules older results stay in the history but are never
+    served again.
+    """
+
+    h = hashlib.sha256()
+
+    for module in (comparator, loader, textstore):
+        with open(module.__file__, "rb") as f:
+            h.update(f.read())
+
+    return h.hexdigest()[:16]
+
+
+def engine_settings(**options):
+    """
+    Run options plus the loader knobs that change extracted text.
+    """
+
+    return {
+        **options,
+        "extraction_mode": loader.EXTRACTION_MODE,
+        "sort_reading_order": loader.SORT_READING_ORDER,
+        "ocr_mode": loader.OCR_MODE,
+        "ocr_dpi": loader.OCR_DPI,
+        "min_text_threshold": loader.MIN_TEXT_THRESHOLD
+    }
+
+
+# =====================================================
+# RESULT STORE
+# =====================================================
+
+class ResultStore:
+    """
+    Comparison results keyed by (master hash, test hash, engine
+    version, settings), indexed by risk and by reason.
+    """
+
+    def __init__(self, db_path=RESULTS_DB, engine=None):
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+
+        self.engine = engine or engine_version()
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+
+        with self._db:
+
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    master_hash TEXT NOT NULL,
+                    test_hash TEXT NOT NULL,
+                    engine TEXT NOT NULL,
+                    settings TEXT NOT NULL,
+                    risk INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    payload TEXT NOT NULL
+                );
+
+                CREATE INDEX IF NOT EXISTS results_risk ON results (risk);
+
+                CREATE TABLE IF NOT EXISTS reasons (
+                    result_key TEXT NOT NULL,
+                    reason TEXT NOT NULL
+                );
+
+                CREATE INDEX IF NOT EXISTS reasons_reason ON reasons (reason);
+                CREATE INDEX IF NOT EXISTS reasons_key ON reasons (result_key);
+            """)
+
+    def _key(self, master_hash, test_hash, settings):
+
+        return hashlib.sha256(
+            json.dumps(
+                [master_hash, test_hash, self.engine, settings],
+                sort_keys=True
+            ).encode("utf-8")
+        ).hexdigest()
+
+    # -------------------------------------------------
+    # GET / PUT
+    # -------------------------------------------------
+
+    def get(self, master_hash, test_hash, settings):
+
+        key = self._key(master_hash, test_hash, settings)
+
+        with self._lock:
+            row = self._db.execute(
+                "SELECT payload FROM results WHERE key = ?", (key,)
+            ).fetchone()
+
+        return json.loads(row[0]) if row else None
+
+    def put(self, master_hash, test_hash, settings, result):
+
+        key = self._key(master_hash, test_hash, settings)
+
+        result = {k: v for k, v in result.items() if k not in RUN_FIELDS}
+
+        with self._lock, self._db:
+
+            self._db.execute(
+                "INSERT OR REPLACE INTO results "
+                "(key, master_hash, test_hash, engine, settings, "
+                "risk, created, payload) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key, master_hash, test_hash, self.engine,
+                    json.dumps(settings, sort_keys=True),
+                    result["risk"], time.time(), json.dumps(result)
+                )
+            )
+
+            self._db.execute(
+                "DELETE FROM reasons WHERE result_key = ?", (key,)
+            )
+
+            self._db.executemany(
+                "INSERT INTO reasons (result_key, reason) VALUES (?, ?)",
+                [(key, reason) for reason in result["reasons"]]
+            )
+
+        return key
+
+    # -------------------------------------------------
+    # HISTORY QUERIES
+    # -------------------------------------------------
+
+    _SUMMARY = (
+        "SELECT r.key, r.master_hash, r.test_hash, r.engine, r.risk, "
+        "r.created "
+        "FROM results r "
+    )
+
+    def _summaries(self, sql, params):
+
+        with self._lock:
+            rows = self._db.execute(self._SUMMARY + sql, params).fetchall()
+
+        return [
+            {
+                "key": key,
+                "master_hash": master_hash,
+                "test_hash": test_hash,
+                "engine": engine,
+                # False: produced by an older engine version
+                "current": engine == self.engine,
+                "risk": risk,
+                "created": time.strftime(
+                    "%Y-%m-%d %H:%M", time.localtime(created)
+                )
+            }
+            for key, master_hash, test_hash, engine, risk, created in rows
+        ]
+
+    def by_risk(self, min_risk, limit=100):
+
+        return self._summaries(
+            "WHERE r.risk >= ? ORDER BY r.risk DESC LIMIT ?",
+            (min_risk, limit)
+        )
+
+    def by_reason(self, reason, limit=100):
+
+        return self._summaries(
+            "JOIN reasons x ON x.result_key = r.key "
+            "WHERE x.reason = ? ORDER BY r.risk DESC LIMIT ?",
+            (reason, limit)
+        )
+
+    def reasons(self):
+
+        with self._lock:
+            return [
+                row[0] for row in self._db.execute(
+                    "SELECT DISTINCT reason FROM reasons ORDER BY reason"
+                )
+            ]
+
+
+# =====================================================
+# SHARED INSTANCE
+# =====================================================
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_result_store():
+
+    global _store
+
+    with _store_lock:
+
+        if _store is None:
+            _store = ResultStore()
+
+        return _store
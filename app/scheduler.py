@@ -0,0 +1,355 @@
+import os
+import heapq
+import itertools
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+
+EXTRACTION_SLOTS = os.cpu_count() or 4   # page workers for ALL sessions
+OCR_SLOTS = max(1, EXTRACTION_SLOTS // 2)   # concurrent tesseract processes
+PROCESS_SLOTS = EXTRACTION_SLOTS   # CPU-bound compare processes, ALL sessions
+MAX_ACTIVE_JOBS = 16      # documents in flight before new ones wait
+ADMISSION_TIMEOUT = 600   # seconds a document may wait for admission
+
+# page counts that split documents into priority classes
+SIZE_CLASSES = (20, 200)
+
+logger = logging.getLogger("scheduler")
+
+
+class SchedulerBusy(RuntimeError):
+    pass
+
+
+# =====================================================
+# TICKET (ONE PER USER REQUEST)
+# =====================================================
+
+class Ticket:
+    """
+    Groups the jobs of one user request so the UI can ask
+    for its queue position.
+    """
+
+    def __init__(self):
+        self.jobs = []
+        self.waiting = False
+
+
+# =====================================================
+# JOB (ONE PER DOCUMENT)
+# =====================================================
+
+class Job:
+
+    def __init__(self, scheduler, size, seq, ticket):
+
+        self.scheduler = scheduler
+        self.size = size
+        self.seq = seq
+        self.ticket = ticket
+
+        self.size_class = sum(size > limit for limit in SIZE_CLASSES)
+        self.submitted = 0
+
+        # unfinished tasks only (guarded by the scheduler lock), so
+        # results the caller has consumed can be freed
+        self.futures = set()
+
+    def submit(self, fn, *args):
+
+        return self.scheduler._submit(self, fn, args)
+
+    def submit_process(self, fn, *args):
+        """
+        submit() for CPU-bound work: fn runs in the shared process
+        pool (fn and args must pickle) but still waits its turn in
+        the queue, so sessions share the cores fairly.
+        """
+
+        return self.submit(self.scheduler._in_process, fn, args)
+
+    def close(self):
+        """
+        Drop queued work (e.g. after an error), wait for tasks that
+        are already running, then free the job slot. The caller may
+        release what the tasks use (e.g. close the document) after.
+        """
+
+        with self.scheduler._cond:
+            futures = list(self.futures)
+
+        for future in futures:
+            future.cancel()
+
+        wait(futures)
+
+        self.scheduler._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# =====================================================
+# SCHEDULER
+# =====================================================
+
+class Scheduler:
+    """
+    Process-wide pool shared by every Streamlit session.
+
+    Queue order is (size class, task index within job, job arrival):
+    small documents run before huge scans, and jobs of the same
+    class take turns page by page instead of running back to back.
+    """
+
+    def __init__(self, workers=EXTRACTION_SLOTS, ocr_slots=OCR_SLOTS,
+                 max_jobs=MAX_ACTIVE_JOBS, processes=PROCESS_SLOTS):
+
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.processes = processes
+
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+        self.ocr = threading.BoundedSemaphore(ocr_slots)
+
+        self._cond = threading.Condition()
+        self._heap = []
+        self._active = set()
+        self._waiters = []
+        self._job_seq = itertools.count()
+        self._task_seq = itertools.count()
+
+        for n in range(workers):
+            threading.Thread(
+                target=self._run,
+                name=f"extract-{n}",
+                daemon=True
+            ).start()
+
+    # -------------------------------------------------
+    # ADMISSION (BACKPRESSURE)
+    # -------------------------------------------------
+
+    def job(self, size, ticket=None, timeout=ADMISSION_TIMEOUT):
+        """
+        Reserve a job slot for a document of `size` pages.
+        Blocks while MAX_ACTIVE_JOBS documents are in flight.
+        """
+
+        ticket = ticket or Ticket()
+
+        with self._cond:
+
+            ticket.waiting = True
+            self._waiters.append(ticket)
+
+            try:
+                admitted = self._cond.wait_for(
+                    lambda: (
+                        len(self._active) < self.max_jobs
+                        and self._waiters[0] is ticket
+                    ),
+                    timeout
+                )
+            finally:
+                self._waiters.remove(ticket)
+                ticket.waiting = False
+                self._cond.notify_all()
+
+            if not admitted:
+                raise SchedulerBusy(
+                    "Server busy — too many documents in progress. "
+                    "Please try again shortly."
+                )
+
+            job = Job(self, size, next(self._job_seq), ticket)
+
+            self._active.add(job)
+            ticket.jobs.append(job)
+
+        return job
+
+    def _release(self, job):
+
+        with self._cond:
+            self._active.discard(job)
+            self._cond.notify_all()
+
+    # -------------------------------------------------
+    # TASKS
+    # -------------------------------------------------
+
+    def _submit(self, job, fn, args):
+
+        future = Future()
+
+        with self._cond:
+
+            key = (job.size_class, job.submitted, job.seq)
+            job.submitted += 1
+            job.futures.add(future)
+
+            heapq.heappush(
+                self._heap,
+                (key, next(self._task_seq), job, future, fn, args)
+            )
+
+            self._cond.notify_all()
+
+        return future
+
+    def _run(self):
+
+        while True:
+
+            with self._cond:
+
+                self._cond.wait_for(lambda: self._heap)
+
+                _, _, job, future, fn, args = heapq.heappop(self._heap)
+
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args))
+                except BaseException as e:
+                    future.set_exception(e)
+
+            with self._cond:
+                job.futures.discard(future)
+
+    # -------------------------------------------------
+    # PROCESS POOL (CPU-BOUND TASKS)
+    # -------------------------------------------------
+
+    def _process_pool(self):
+        """
+        One long-lived pool for the whole server, started on first
+        use. "spawn" so workers never inherit this process's threads
+        or open SQLite handles.
+        """
+
+        with self._pool_lock:
+
+            if self._pool is None:
+                logger.info(f"Starting {self.processes} compare processes")
+                self._pool = ProcessPoolExecutor(
+                    self.processes,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+
+            return self._pool
+
+    def _drop_pool(self, pool):
+        """
+        Forget a broken pool (e.g. a child was OOM-killed) so the
+        next task starts a fresh one.
+        """
+
+        with self._pool_lock:
+
+            if self._pool is not pool:
+                return
+
+            logger.warning("Compare process died, restarting the pool")
+            self._pool = None
+
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _in_process(self, fn, args):
+
+        # the calling worker thread holds this task's queue slot
+        pool = self._process_pool()
+
+        try:
+            future = pool.submit(fn, *args)
+        except BrokenProcessPool:
+            # broke before this task was sent: safe to run it anew
+            self._drop_pool(pool)
+            pool = self._process_pool()
+            future = pool.submit(fn, *args)
+
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            # this task may be what killed it; fail it, don't retry
+            self._drop_pool(pool)
+            raise
+
+    # -------------------------------------------------
+    # QUEUE POSITION
+    # -------------------------------------------------
+
+    def position(self, ticket):
+        """
+        Number of other documents ahead of this request.
+        0 once its pages are being processed.
+        """
+
+        with self._cond:
+
+            if ticket.waiting:
+                ahead = self._waiters.index(ticket)
+                return len(self._active) + ahead + 1
+
+            mine = set(ticket.jobs)
+
+            first = {}
+            for key, _, job, future, _, _ in self._heap:
+                if not future.cancelled():
+                    first[job] = min(first.get(job, key), key)
+
+            own = [first[job] for job in mine if job in first]
+
+            if not own:
+                return 0
+
+            running = any(
+                f.running() for job in mine for f in job.futures
+            )
+
+            if running:
+                return 0
+
+            best = min(own)
+
+            return sum(
+                1 for job, key in first.items()
+                if job not in mine and key < best
+            )
+
+
+# =====================================================
+# SHARED INSTANCE
+# =====================================================
+
+_scheduler = None
+_lock = threading.Lock()
+
+
+def get_scheduler():
+
+    global _scheduler
+
+    with _lock:
+
+        if _scheduler is None:
+            logger.info(
+                f"Scheduler: {EXTRACTION_SLOTS} extraction slots, "
+                f"{OCR_SLOTS} OCR slots, {PROCESS_SLOTS} compare processes"
+            )
+            _scheduler = Scheduler()
+
+        return _scheduler
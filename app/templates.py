@@ -0,0 +1,304 @@
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+from collections import Counter
+
+from loader import load_document
+from utils import file_sha256
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+
+LIBRARY_DIR = "library"
+LIBRARY_DB = os.path.join(LIBRARY_DIR, "templates.db")
+
+SHINGLE_SIZE = 5     # words per shingle
+NUM_PERM = 128       # signature slots
+BANDS = 32           # LSH bands (NUM_PERM / BANDS rows each)
+BRUTE_FORCE_LIMIT = 2000   # scan everything when the index finds nothing
+MIN_SIMILARITY = 0.2       # weaker matches are not offered as masters
+
+logger = logging.getLogger("templates")
+
+
+# =====================================================
+# MINHASH SIGNATURE
+# =====================================================
+
+def _hash64(data):
+    return int.from_bytes(
+        hashlib.blake2b(data, digest_size=8).digest(), "little"
+    )
+
+
+def signature(text):
+    """
+    One-permutation MinHash over word shingles.
+
+    Each shingle is hashed once; its hash picks a slot and competes
+    for that slot's minimum. Empty slots borrow from the next filled
+    slot, so short documents still get a full signature.
+    """
+
+    words = text.lower().split()
+
+    sig = [None] * NUM_PERM
+
+    for i in range(max(len(words) - SHINGLE_SIZE + 1, 1)):
+
+        shingle = " ".join(words[i:i + SHINGLE_SIZE])
+        h = _hash64(shingle.encode("utf-8"))
+
+        slot = h % NUM_PERM
+        value = h // NUM_PERM
+
+        if sig[slot] is None or value < sig[slot]:
+            sig[slot] = value
+
+    if all(v is None for v in sig):
+        return array("Q", [0] * NUM_PERM)
+
+    # densify: rotate right until a filled slot, offset by distance
+    for slot in range(NUM_PERM):
+
+        if sig[slot] is not None:
+            continue
+
+        step = 1
+        while sig[(slot + step) % NUM_PERM] is None:
+            step += 1
+
+        sig[slot] = (sig[(slot + step) % NUM_PERM] + step) % (1 << 58)
+
+    return array("Q", sig)
+
+
+def similarity(a, b):
+    """
+    Estimated Jaccard similarity of two signatures.
+    """
+
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+
+
+def band_keys(sig):
+
+    rows = NUM_PERM // BANDS
+
+    for band in range(BANDS):
+
+        chunk = sig[band * rows:(band + 1) * rows].tobytes()
+
+        # signed so it fits an SQLite INTEGER
+        yield band, _hash64(chunk) - (1 << 63)
+
+
+# =====================================================
+# TEMPLATE LIBRARY
+# =====================================================
+
+class TemplateLibrary:
+    """
+    Master documents plus their signatures, indexed by LSH band so
+    a lookup touches only templates sharing at least one band.
+    """
+
+    def __init__(self, db_path=LIBRARY_DB, files_dir=LIBRARY_DIR):
+
+        self.files_dir = files_dir
+        os.makedirs(files_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS templates (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                path TEXT NOT NULL,
+                content_hash TEXT UNIQUE NOT NULL,
+                pages INTEGER,
+                signature BLOB NOT NULL,
+                added REAL
+            );
+
+            CREATE TABLE IF NOT EXISTS bands (
+                band INTEGER NOT NULL,
+                key INTEGER NOT NULL,
+                template_id INTEGER NOT NULL
+            );
+
+            CREATE INDEX IF NOT EXISTS bands_lookup ON bands (band, key);
+        """)
+
+    def __len__(self):
+
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM templates"
+            ).fetchone()[0]
+
+    # -------------------------------------------------
+    # ADD
+    # -------------------------------------------------
+
+    def add(self, path, name=None):
+        """
+        Copy a master into the library and index it.
+        Re-adding the same file is a no-op. Returns the template id.
+        """
+
+        digest = file_sha256(path)
+
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id FROM templates WHERE content_hash = ?",
+                (digest,)
+            ).fetchone()
+
+        if row:
+            return row[0]
+
+        pages = load_document(path)
+        sig = signature(" ".join(pages.values()))
+
+        ext = os.path.splitext(path)[1].lower()
+        stored = os.path.join(self.files_dir, digest + ext)
+
+        # same content → same bytes, so a concurrent add of this file
+        # may replace it; the rename keeps readers off a partial copy
+        tmp = f"{stored}.{threading.get_ident()}.part"
+        shutil.copyfile(path, tmp)
+        os.replace(tmp, stored)
+
+        with self._lock, self._db:
+
+            # a concurrent add of the same file may have won the race
+            cur = self._db.execute(
+                "INSERT OR IGNORE INTO templates "
+                "(name, path, content_hash, pages, signature, added) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    name or os.path.basename(path), stored, digest,
+                    len(pages), sig.tobytes(), time.time()
+                )
+            )
+
+            if not cur.rowcount:
+                return self._db.execute(
+                    "SELECT id FROM templates WHERE content_hash = ?",
+                    (digest,)
+                ).fetchone()[0]
+
+            template_id = cur.lastrowid
+
+            self._db.executemany(
+                "INSERT INTO bands (band, key, template_id) VALUES (?, ?, ?)",
+                [(band, key, template_id) for band, key in band_keys(sig)]
+            )
+
+        logger.info(f"Template added: {name or path} (id {template_id})")
+
+        return template_id
+
+    # -------------------------------------------------
+    # LOOKUP
+    # -------------------------------------------------
+
+    def find(self, text, k=5, min_similarity=MIN_SIMILARITY):
+        """
+        Top-k masters most similar to `text`:
+        [{"id", "name", "path", "similarity"}], best first.
+        Empty when nothing reaches min_similarity, or for text
+        without words (e.g. failed OCR), whose signature would match
+        every other empty template.
+        """
+
+        if not text.split():
+            return []
+
+        sig = signature(text)
+
+        with self._lock:
+
+            hits = Counter()
+
+            for band, key in band_keys(sig):
+                for (template_id,) in self._db.execute(
+                    "SELECT template_id FROM bands WHERE band = ? AND key = ?",
+                    (band, key)
+                ):
+                    hits[template_id] += 1
+
+            if hits:
+                ids = list(hits)
+                rows = []
+
+                # SQLite caps bound parameters per statement
+                for i in range(0, len(ids), 500):
+                    chunk = ids[i:i + 500]
+                    rows += self._db.execute(
+                        "SELECT id, name, path, signature FROM templates "
+                        f"WHERE id IN ({','.join('?' * len(chunk))})",
+                        chunk
+                    ).fetchall()
+
+            elif self._db.execute(
+                "SELECT COUNT(*) FROM templates"
+            ).fetchone()[0] <= BRUTE_FORCE_LIMIT:
+                rows = self._db.execute(
+                    "SELECT id, name, path, signature FROM templates"
+                ).fetchall()
+
+            else:
+                rows = []
+
+        scored = []
+
+        for template_id, name, path, blob in rows:
+
+            other = array("Q")
+            other.frombytes(blob)
+
+            score = similarity(sig, other)
+
+            if score < min_similarity:
+                continue
+
+            scored.append({
+                "id": template_id,
+                "name": name,
+                "path": path,
+                "similarity": round(score, 3)
+            })
+
+        scored.sort(key=lambda r: -r["similarity"])
+
+        return scored[:k]
+
+
+# =====================================================
+# SHARED INSTANCE
+# =====================================================
+
+_library = None
+_library_lock = threading.Lock()
+
+
+def get_library():
+
+    global _library
+
+    with _library_lock:
+
+        if _library is None:
+            _library = TemplateLibrary()
+
+        return _library
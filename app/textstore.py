@@ -0,0 +1,221 @@
+import io
+import re
+import mmap
+import tempfile
+from array import array
+
+
+# =====================================================
+# CONFIG
+# =====================================================
+
+PAGE_SEPARATOR = b"\n\n"
+
+# tokens ending in "." that do not close a sentence
+ABBREVIATIONS = {
+    b"mr.", b"mrs.", b"ms.", b"dr.", b"no.", b"nos.", b"inc.",
+    b"ltd.", b"co.", b"corp.", b"art.", b"sec.", b"cl.", b"vs.",
+    b"e.g.", b"i.e.", b"etc.", b"approx.", b"para.", b"st."
+}
+
+token_pattern = re.compile(rb"\S+")
+sentence_end = re.compile(rb"[.!?][\"')\]]*$")
+
+
+# =====================================================
+# SHARED VOCABULARY
+# =====================================================
+
+class Vocabulary:
+    """
+    Maps each distinct raw token to a small int, so token streams
+    can be stored as array('I') and diffed without Python strings.
+    Share one instance between the two documents of a comparison.
+    """
+
+    def __init__(self):
+        self.ids = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def id(self, token):
+        return self.ids.setdefault(token, len(self.ids))
+
+    def table(self, fn):
+        """
+        fn(token) for every distinct token, indexed by token id.
+        """
+
+        out = [None] * len(self.ids)
+
+        for token, i in self.ids.items():
+            out[i] = fn(token.decode("utf-8", errors="replace"))
+
+        return out
+
+
+# =====================================================
+# TEXT STORE
+# =====================================================
+
+class TextStore:
+    """
+    A document's text stored once as UTF-8 (in memory or in a
+    memory-mapped temp file), plus offset arrays:
+
+        token_starts / token_ends  byte offsets of every token
+        token_ids                  vocabulary id of every token
+        sentence_starts            first token index of every sentence
+    """
+
+    def __init__(self, vocab, spill_dir=None):
+
+        self.vocab = vocab
+        self.spill_dir = spill_dir
+
+        if spill_dir is not None:
+            self._file = tempfile.TemporaryFile(dir=spill_dir)
+        else:
+            self._file = io.BytesIO()
+
+        self.buffer = None
+
+        self.token_starts = array("Q")
+        self.token_ends = array("Q")
+        self.token_ids = array("I")
+        self.sentence_starts = array("Q")
+
+    # -------------------------------------------------
+    # BUILD
+    # -------------------------------------------------
+
+    def add_page(self, text):
+
+        if self._file.tell():
+            self._file.write(PAGE_SEPARATOR)
+
+        self._file.write(text.encode("utf-8"))
+
+    def seal(self):
+        """
+        Stop writing, map the text and build the offset arrays.
+        """
+
+        self._file.flush()
+
+        if isinstance(self._file, io.BytesIO):
+            self.buffer = self._file.getbuffer()
+        elif self._file.tell():
+            self.buffer = mmap.mmap(
+                self._file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        else:
+            self.buffer = b""   # mmap refuses empty files
+
+        new_sentence = True
+
+        for match in token_pattern.finditer(self.buffer):
+
+            token = match.group()
+
+            if new_sentence:
+                self.sentence_starts.append(len(self.token_ids))
+
+            self.token_starts.append(match.start())
+            self.token_ends.append(match.end())
+            self.token_ids.append(self.vocab.id(token))
+
+            new_sentence = (
+                sentence_end.search(token) is not None
+                and token.lower() not in ABBREVIATIONS
+            )
+
+        return self
+
+    def close(self):
+
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+        elif isinstance(self.buffer, memoryview):
+            self.buffer.release()
+
+        self.buffer = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # -------------------------------------------------
+    # ACCESS
+    # -------------------------------------------------
+
+    def __len__(self):
+        return len(self.token_ids)
+
+    def span_text(self, i1, i2):
+        """
+        Original text covering tokens [i1, i2).
+        """
+
+        if i1 >= i2:
+            return ""
+
+        return bytes(
+            self.buffer[self.token_starts[i1]:self.token_ends[i2 - 1]]
+        ).decode("utf-8", errors="replace")
+
+    def sentence_bounds(self, i):
+
+        start = self.sentence_starts[i]
+
+        if i + 1 < len(self.sentence_starts):
+            end = self.sentence_starts[i + 1]
+        else:
+            end = len(self.token_ids)
+
+        return start, end
+
+    def sentences(self, normalize=None, token_text=None):
+        return SentenceView(self, normalize, token_text)
+
+
+class SentenceView:
+    """
+    Read-only sequence of sentences, decoded on access.
+
+    With token_text (a Vocabulary.table), a sentence is its tokens'
+    table entries joined by spaces; the text buffer is not read.
+    """
+
+    def __init__(self, store, normalize=None, token_text=None):
+        self.store = store
+        self.normalize = normalize
+        self.token_text = token_text
+
+    def __len__(self):
+        return len(self.store.sentence_starts)
+
+    def __getitem__(self, i):
+
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+
+        start, end = self.store.sentence_bounds(i)
+
+        if self.token_text is not None:
+            table = self.token_text
+            return " ".join(
+                table[t] for t in self.store.token_ids[start:end]
+            )
+
+        text = self.store.span_text(start, end)
+
+        return self.normalize(text) if self.normalize else text
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
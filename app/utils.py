@@ -1,9 +1,16 @@
 import os
-import uuid
 import time
+import sys
+import hashlib
 import logging
+import threading
 from pathlib import Path
 
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
 
 # =====================================================
 # CONFIG
@@ -12,6 +19,10 @@ from pathlib import Path
 TEMP_DIR = "temp"
 MAX_FILE_SIZE_MB = 50   # protect your server
 
+STORE_MAX_MB = 2048          # total size of unreferenced uploads kept
+STORE_MAX_AGE_MINUTES = 60   # unreferenced uploads older than this go
+JANITOR_INTERVAL = 300       # seconds between background evictions
+
 
 # =====================================================
 # TEMP DIRECTORY
@@ -21,32 +32,232 @@ def ensure_temp():
     Path(TEMP_DIR).mkdir(exist_ok=True)
 
 
+# =====================================================
+# UPLOAD STORE (CONTENT-ADDRESSED)
+# =====================================================
+
+class UploadStore:
+    """
+    Uploads stored once per content hash under TEMP_DIR.
+
+    Each acquire() takes a reference that the caller must release()
+    when its job finishes; only unreferenced files are evicted.
+    Eviction runs on a background janitor, never on the request path.
+    """
+
+    def __init__(self, root=TEMP_DIR, max_mb=STORE_MAX_MB,
+                 max_age_minutes=STORE_MAX_AGE_MINUTES):
+
+        self.root = root
+        self.max_bytes = max_mb * 1024 * 1024
+        self.max_age = max_age_minutes * 60
+
+        self._lock = threading.Lock()
+        self._entries = {}   # path → {"size", "last_used", "refs"}
+        self._janitor = None
+
+        Path(root).mkdir(exist_ok=True)
+
+        # adopt files left by a previous run (one scan, at startup)
+        for file in Path(root).iterdir():
+            if file.is_file():
+                st = file.stat()
+                self._entries[str(file)] = {
+                    "size": st.st_size,
+                    "last_used": st.st_mtime,
+                    "refs": 0
+                }
+
+    def acquire(self, data, name):
+        """
+        Store `data` (bytes-like) and take a reference to it.
+        Returns the file path.
+        """
+
+        digest = hashlib.sha256(data).hexdigest()
+        ext = os.path.splitext(name)[1].lower()
+
+        path = os.path.join(self.root, digest + ext)
+
+        with self._lock:
+            if self._take(path):
+                return path
+
+        # write outside the lock: a large upload must not stall
+        # other requests or the janitor
+        tmp = f"{path}.{threading.get_ident()}.part"
+
+        with open(tmp, "wb") as f:
+            f.write(data)
+
+        with self._lock:
+
+            # another request stored the same content meanwhile
+            if self._take(path):
+                os.unlink(tmp)
+                return path
+
+            os.replace(tmp, path)
+
+            self._entries[path] = {
+                "size": len(data),
+                "last_used": time.time(),
+                "refs": 0
+            }
+
+            self._take(path)
+
+        return path
+
+    def _take(self, path):
+        """
+        Reference an indexed file (caller holds the lock). Entries
+        whose file vanished from disk are dropped instead.
+        """
+
+        entry = self._entries.get(path)
+
+        if entry is None:
+            return False
+
+        if not os.path.exists(path):
+            del self._entries[path]
+            return False
+
+        entry["refs"] += 1
+        entry["last_used"] = time.time()
+
+        return True
+
+    def release(self, path):
+
+        with self._lock:
+
+            entry = self._entries.get(path)
+
+            # not ours (e.g. a library master)
+            if entry is None:
+                return
+
+            entry["refs"] = max(entry["refs"] - 1, 0)
+            entry["last_used"] = time.time()
+
+    def evict(self, max_age=None):
+        """
+        Drop unreferenced files past max_age, then the least recently
+        used ones until the store fits in its quota.
+        """
+
+        max_age = self.max_age if max_age is None else max_age
+        now = time.time()
+
+        with self._lock:
+
+            idle = sorted(
+                (e["last_used"], path)
+                for path, e in self._entries.items()
+                if e["refs"] == 0
+            )
+
+            total = sum(e["size"] for e in self._entries.values())
+
+            victims = []
+
+            for last_used, path in idle:
+                if now - last_used > max_age or total > self.max_bytes:
+                    victims.append(path)
+                    total -= self._entries.pop(path)["size"]
+
+            # unlink under the lock, so a concurrent acquire() of the
+            # same content cannot have its fresh file deleted
+            for path in victims:
+                try:
+                    os.unlink(path)
+                    logger.info(f"Deleted temp file: {path}")
+                except OSError:
+                    pass
+
+        return len(victims)
+
+    def start_janitor(self, interval=JANITOR_INTERVAL):
+
+        if self._janitor is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.evict()
+                except Exception as e:
+                    logger.warning(f"Upload janitor failed: {e}")
+
+        self._janitor = threading.Thread(
+            target=run, name="upload-janitor", daemon=True
+        )
+        self._janitor.start()
+
+
+_upload_store = None
+_upload_store_lock = threading.Lock()
+
+
+def get_upload_store():
+
+    global _upload_store
+
+    with _upload_store_lock:
+
+        if _upload_store is None:
+            _upload_store = UploadStore()
+            _upload_store.start_janitor()
+
+        return _upload_store
+
+
+# =====================================================
+# FILE HASH
+# =====================================================
+
+def file_sha256(path, chunk_size=1024 * 1024):
+
+    h = hashlib.sha256()
+
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
 # =====================================================
 # SAFE FILE SAVE
 # =====================================================
 
 def save_uploaded_file(uploaded_file):
-
-    ensure_temp()
+    """
+    Store an upload (deduplicated by content) and return its path.
+    Call release_uploaded_file(path) once the job is done with it.
+    """
 
     # 🔥 rewind pointer (important for DOCX)
     uploaded_file.seek(0)
 
-    file_size_mb = len(uploaded_file.getbuffer()) / (1024 * 1024)
+    data = uploaded_file.getbuffer()
+
+    file_size_mb = len(data) / (1024 * 1024)
 
     if file_size_mb > MAX_FILE_SIZE_MB:
         raise ValueError(
             f"File too large ({file_size_mb:.1f} MB). Max allowed is {MAX_FILE_SIZE_MB}MB"
         )
 
-    unique_name = f"{uuid.uuid4()}_{uploaded_file.name}"
+    return get_upload_store().acquire(data, uploaded_file.name)
 
-    path = os.path.join(TEMP_DIR, unique_name)
 
-    with open(path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+def release_uploaded_file(path):
 
-    return path
+    get_upload_store().release(path)
 
 
 
@@ -91,22 +302,35 @@ def timer(func):
 
 
 # =====================================================
-# CLEAN TEMP FILES
+# MEMORY USAGE
 # =====================================================
 
-def cleanup_temp(older_than_minutes=60):
+def peak_rss_mb():
+    """
+    Peak resident memory of this process since it started, in MB
+    (None on Windows). Not per run: ru_maxrss never goes down, and
+    every session of the server shares the process.
+    """
 
-    now = time.time()
+    if resource is None:
+        return None
 
-    for file in Path(TEMP_DIR).glob("*"):
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
 
-        if file.is_file():
+    # Linux reports KB, macOS reports bytes
+    if sys.platform == "darwin":
+        peak /= 1024
 
-            age = (now - file.stat().st_mtime) / 60
+    return round(peak / 1024, 1)
 
-            if age > older_than_minutes:
-                try:
-                    file.unlink()
-                    logger.info(f"Deleted temp file: {file}")
-                except:
-                    pass
+
+# =====================================================
+# CLEAN TEMP FILES
+# =====================================================
+
+def cleanup_temp(older_than_minutes=60):
+    """
+    Evict idle uploads now. Normally the janitor does this.
+    """
+
+    return get_upload_store().evict(older_than_minutes * 60)
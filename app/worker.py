@@ -1,14 +1,140 @@
-from loader import load_document
-from comparator import smart_compare
+from loader import load_document, load_into_store
+from comparator import smart_compare, store_compare, incremental_compare
+from textstore import TextStore, Vocabulary
+from utils import peak_rss_mb, file_sha256
+from templates import get_library
+from results import get_result_store, engine_settings
 
 
-def process(master_path, normal_path):
+def process(master_path, normal_path, mode="sentence",
+            low_memory=False, spill_dir=None, incremental=False,
+            ticket=None, use_store=True, workers=None):
+    """
+    ticket: scheduler.Ticket used by the UI to poll queue position.
+    use_store: reuse / save results in the persistent result store.
+    workers: score sentences in this many process-pool tasks
+             (same result as the serial compare).
+    """
 
-    master = load_document(master_path)
-    normal = load_document(normal_path)
+    if not use_store:
+        return compare_files(
+            master_path, normal_path, mode,
+            low_memory, spill_dir, incremental, ticket, workers
+        )
+
+    store = get_result_store()
+
+    settings = engine_settings(
+        mode=mode,
+        low_memory=low_memory,
+        incremental=incremental
+    )
+
+    master_hash = file_sha256(master_path)
+    normal_hash = file_sha256(normal_path)
+
+    cached = store.get(master_hash, normal_hash, settings)
+
+    if cached is not None:
+        cached["from_store"] = True
+        return cached
+
+    result = compare_files(
+        master_path, normal_path, mode,
+        low_memory, spill_dir, incremental, ticket, workers
+    )
+
+    store.put(master_hash, normal_hash, settings, result)
+
+    return result
+
+
+def compare_files(master_path, normal_path, mode="sentence",
+                  low_memory=False, spill_dir=None, incremental=False,
+                  ticket=None, workers=None):
+
+    if low_memory:
+        return process_low_memory(
+            master_path, normal_path, mode, spill_dir, ticket
+        )
+
+    if incremental:
+        return process_incremental(master_path, normal_path, ticket)
+
+    master = load_document(master_path, ticket=ticket)
+    normal = load_document(normal_path, ticket=ticket)
 
     master_text = "\n\n".join(master.values())
     normal_text = "\n\n".join(normal.values())
 
 
-    return smart_compare(master_text, normal_text)
+    result = smart_compare(
+        master_text, normal_text, mode=mode, workers=workers,
+        ticket=ticket
+    )
+    result["peak_rss_mb"] = peak_rss_mb()
+
+    return result
+
+
+def process_low_memory(master_path, normal_path, mode="sentence",
+                       spill_dir=None, ticket=None):
+    """
+    Text is kept once per document in a TextStore (memory-mapped
+    from spill_dir when given); no page dicts or word lists.
+    """
+
+    if mode != "sentence":
+        raise ValueError("Low-memory mode only supports sentence alignment.")
+
+    vocab = Vocabulary()
+
+    with TextStore(vocab, spill_dir) as master, \
+            TextStore(vocab, spill_dir) as normal:
+
+        load_into_store(master_path, master, ticket)
+        load_into_store(normal_path, normal, ticket)
+
+        result = store_compare(master, normal)
+
+    result["peak_rss_mb"] = peak_rss_mb()
+
+    return result
+
+
+def process_incremental(master_path, normal_path, ticket=None):
+    """
+    Page-by-page comparison; pages already extracted or compared in
+    an earlier run (e.g. a previous revision) are spliced from cache.
+    """
+
+    master_stats = {}
+    normal_stats = {}
+
+    master = load_document(master_path, master_stats, ticket)
+    normal = load_document(normal_path, normal_stats, ticket)
+
+    result = incremental_compare(master, normal)
+
+    result["reused"]["extraction_cached"] = {
+        "master": master_stats.get("cached_pages", []),
+        "test": normal_stats.get("cached_pages", [])
+    }
+    result["peak_rss_mb"] = peak_rss_mb()
+
+    return result
+
+
+def find_masters(test_path, k=5):
+    """
+    Candidate masters for a test document from the template library.
+    """
+
+    test = load_document(test_path)
+
+    return get_library().find(" ".join(test.values()), k)
+
+
+def add_master(path, name=None):
+
+    return get_library().add(path, name)